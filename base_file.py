@@ -10,7 +10,7 @@ class FileType(Enum):
     UNKNOWN = 0  # Unknown file.
     DIR = 1  # Directory. A type of file that contains other files.
     TEXT_FILE = 2   # File with text content.
-    #BINARY_FILE = 3 Unsupported. Could be images, videos etc.
+    BINARY_FILE = 3  # File with binary content. Could be images, videos etc.
 
 class BaseFile(ABC):
     """ Base class for all File System objects. It provides a skeleton structure + some helper methods.
@@ -19,6 +19,11 @@ class BaseFile(ABC):
       - Register extension supported by your file. 
     """
 
+    # Generation of the last change to this file or its subtree, and generation at which it was attached
+    # to its parent. Maintained by the generations module. Class defaults keep older drive images loadable.
+    generation = 0
+    attached_generation = 0
+
     def __init__(self, name: str, type: FileType, parent=None):
         """ Initialize a file object.
         Argument:
@@ -30,6 +35,10 @@ class BaseFile(ABC):
         self._type = type
         self._parent = parent
 
+    def __bool__(self) -> bool:
+        """ Files are always truthy, even if a subclass defines __len__."""
+        return True
+
     @property
     def name(self) -> str:
         return self._name
@@ -50,6 +59,14 @@ class BaseFile(ABC):
     def parent(self, new_parent):
         self._parent = new_parent
 
+    @property
+    def drive(self):
+        """ Returns the MemFileSystem that holds this file, or None if the file is detached."""
+        cur_art = self
+        while cur_art.parent:
+            cur_art = cur_art.parent
+        return getattr(cur_art, "owner_drive", None)
+
     @property
     def absolute_path(self):
         """ Helper function to generate the absolute path from root.."""
@@ -65,6 +82,10 @@ class BaseFile(ABC):
             return abs_path[1:]
         return abs_path
 
+    def copy(self):
+        """ Returns a detached copy of the file. Types that support cp override this."""
+        return None
+
     @abstractmethod
     def __iter__(self):
         pass
@@ -0,0 +1,160 @@
+""" Micro benchmarks for the in-mem filesystem.
+Run: python benchmarks.py
+"""
+import io
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from logging_utils import DebugLogger
+from mem_fs import MemFileSystem, FileType
+from file_extension_registry import file_creator_factory
+
+
+def _provisioning_ops(fs, prefix, num_dirs):
+    """ Returns a list of mk/write/mv/rm operations similar to a provisioning job."""
+    ops = []
+    for i in range(num_dirs):
+        dir_path = f"/{prefix}_{i}"
+        file_path = f"{dir_path}/notes.txt"
+        ops.append(lambda p=dir_path: fs.make_file(fs.root, p, FileType.DIR))
+        ops.append(lambda p=file_path: fs.make_file(fs.root, p, FileType.TEXT_FILE))
+        ops.append(lambda p=file_path: fs.write_file(fs.root, p, "hello world"))
+        ops.append(lambda p=file_path: fs.write_file(fs.root, p, "more", write_mode="append"))
+        ops.append(lambda p=f"{dir_path}/tmp.txt": fs.make_file(fs.root, p, FileType.TEXT_FILE))
+        ops.append(lambda p=f"{dir_path}/tmp.txt": fs.remove_file(fs.root, p))
+    return ops
+
+
+def bench_transactions(num_dirs=5000, batch_size=500, num_runs=3):
+    """ Compares operations issued one by one with the same operations committed in batches, without and
+    with a change subscriber. Each operation flushes its change events. A transaction flushes once per commit.
+    Reports the best of num_runs runs.
+    """
+
+    def run(subscribed, batched):
+        fs = MemFileSystem("bench_txn", register=False)
+        events = fs.watch("/") if subscribed else None
+        ops = _provisioning_ops(fs, "ops", num_dirs)
+        start = time.perf_counter()
+        if batched:
+            for batch_start in range(0, len(ops), batch_size):
+                with fs.transaction():
+                    for op in ops[batch_start:batch_start + batch_size]:
+                        op()
+        else:
+            for op in ops:
+                op()
+        secs = time.perf_counter() - start
+        if events:
+            events.close()
+        return len(ops), secs
+
+    for subscribed in [False, True]:
+        num_ops, single_secs = min(run(subscribed, False) for _ in range(num_runs))
+        _, batched_secs = min(run(subscribed, True) for _ in range(num_runs))
+        print(f"Transactions ({'one subscriber' if subscribed else 'no subscribers'}): {num_ops} ops. "
+              f"One by one: {num_ops / single_secs:,.0f} ops/s. "
+              f"Batches of {batch_size}: {num_ops / batched_secs:,.0f} ops/s.")
+
+
+def bench_watch(num_writes=50000):
+    """ Cost of the change notifications on the write path, with and without a subscriber."""
+    fs = MemFileSystem("bench_watch", register=False)
+    fs.make_file(fs.root, "/logs", FileType.DIR)
+    fs.make_file(fs.root, "/logs/app.txt", FileType.TEXT_FILE)
+    file, _ = fs.get_file(fs.root, "/logs/app.txt")
+
+    def run():
+        start = time.perf_counter()
+        for _ in range(num_writes):
+            file.add_content("line", write_mode="append")
+        return num_writes / (time.perf_counter() - start)
+
+    no_subscribers = run()
+    with fs.watch("/logs") as events:
+        one_subscriber = run()
+        pending = len(events)
+    print(f"Watch: {num_writes} appends. No subscribers: {no_subscribers:,.0f} writes/s. "
+          f"One subscriber: {one_subscriber:,.0f} writes/s ({pending} coalesced event(s) queued).")
+
+
+def bench_incremental_export(num_dirs=200, files_per_dir=1000):
+    """ Full export versus an incremental export after a single write."""
+    fs = MemFileSystem("bench_export", register=False)
+    for i in range(num_dirs):
+        fs.make_file(fs.root, f"/dir_{i}", FileType.DIR)
+        directory, _ = fs.get_dir(fs.root, f"/dir_{i}")
+        for j in range(files_per_dir):
+            file, _ = file_creator_factory(f"file_{j}.txt", parent=directory)
+            directory.add_content(file)
+    start = time.perf_counter()
+    generation, full_records = fs.export_since(0, io.StringIO())
+    full_secs = time.perf_counter() - start
+    fs.write_file(fs.root, f"/dir_{num_dirs // 2}/file_7.txt", "changed")
+    start = time.perf_counter()
+    _, delta_records = fs.export_since(generation, io.StringIO())
+    delta_secs = time.perf_counter() - start
+    print(f"Export: {full_records:,} records in {full_secs * 1e3:,.1f} ms. "
+          f"After one write: {delta_records} record(s) in {delta_secs * 1e6:,.0f} us.")
+
+
+def bench_sharding(num_top_dirs=64, files_per_dir=500, num_searches=10):
+    """ Throughput of writes and root-wide searches on a sharded drive, by number of shards."""
+    from sharded_fs import ShardedMemFileSystem  # Starts processes. Only import when needed.
+    shard_counts = sorted({1, 2, os.cpu_count() or 1})
+    for num_shards in shard_counts:
+        with ShardedMemFileSystem("bench_shards", num_shards=num_shards) as drive:
+            ops = [("make_file", ("/", f"/top_{i}", FileType.DIR)) for i in range(num_top_dirs)]
+            drive.execute_many(ops)
+            ops = []
+            for i in range(num_top_dirs):
+                for j in range(files_per_dir):
+                    ops.append(("make_file", ("/", f"/top_{i}/file_{j}.txt", FileType.TEXT_FILE)))
+                    ops.append(("write_file", ("/", f"/top_{i}/file_{j}.txt", f"content {j}")))
+            start = time.perf_counter()
+            drive.execute_many(ops)
+            write_rate = len(ops) / (time.perf_counter() - start)
+            start = time.perf_counter()
+            for _ in range(num_searches):
+                results, _ = drive.search("/", "/", r"file_\d*7\.txt$")
+            search_rate = num_searches / (time.perf_counter() - start)
+        print(f"Sharding: {num_shards} shard(s). {write_rate:,.0f} ops/s. "
+              f"{search_rate:,.1f} root searches/s ({len(results)} matches).")
+
+
+def bench_startup(num_runs=10):
+    """ Cold start of the CLI: time to the first prompt and time to run a one-command script."""
+    main_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py")
+    prompt_secs, script_secs = [], []
+    with tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False) as script:
+        script.write("ls\n")
+    for _ in range(num_runs):
+        start = time.perf_counter()
+        proc = subprocess.Popen([sys.executable, main_path], stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        output = b""
+        while b"default>" not in output:
+            chunk = os.read(proc.stdout.fileno(), 4096)
+            if not chunk:
+                break
+            output += chunk
+        prompt_secs.append(time.perf_counter() - start)
+        proc.communicate(b"exit\n")
+        start = time.perf_counter()
+        subprocess.run([sys.executable, main_path, script.name], stdin=subprocess.DEVNULL,
+                       stdout=subprocess.DEVNULL, check=True)
+        script_secs.append(time.perf_counter() - start)
+    os.remove(script.name)
+    print(f"Startup: {num_runs} runs. Median time to first prompt: {1e3 * statistics.median(prompt_secs):,.1f} ms. "
+          f"One-command script: {1e3 * statistics.median(script_secs):,.1f} ms.")
+
+
+if __name__ == "__main__":
+    DebugLogger.enabled = False
+    bench_startup()
+    bench_transactions()
+    bench_watch()
+    bench_incremental_export()
+    bench_sharding()
@@ -0,0 +1,260 @@
+""" Records the commands of a session and replays them to reproduce workloads.
+A trace is a JSON lines file. Each line holds the time, current drive, pwd and the command:
+
+    {"ts": 1760871234.5, "drive": "default", "pwd": "/movies", "cmd": ["write", "nemo.txt", "dory"]}
+
+Replays run against session-local drives that are not registered, so the drives of the user are never touched.
+Paths that name a drive, e.g. cp movies archive:/, resolve to session drives as well.
+Drives start empty or from images saved with virtual_mem_drive_registry.save_image.
+"""
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager, redirect_stdout
+from constants import Commands
+from environment import Environment
+from file_return_codes import FileReturnCodes
+from logging_utils import DebugLogger
+from mem_fs import MemFileSystem
+import virtual_mem_drive_registry
+
+# Commands with effects outside the session are not replayed: they change the drive registry, write host files,
+# toggle process-wide tracing or hold subscriptions. Commands that read scripts or block on input are skipped too.
+# The commands of a loaded script are recorded one by one.
+SKIPPED_COMMANDS = {Commands.NEW, Commands.MOUNT, Commands.DRIVES, Commands.UNMOUNT, Commands.DROP,
+                    Commands.ATTACH, Commands.LOAD, Commands.LOAD_ALL, Commands.EXPORT, Commands.TRACE,
+                    Commands.REPLAY, Commands.WATCH, Commands.MEM_TRACE, Commands.EXIT}
+PACED = "paced"  # Keep the gaps between commands of the trace.
+MAX_SPEED = "max"  # Issue commands back to back.
+
+
+def is_replayable(comps: list[str]) -> bool:
+    """ tail -f waits for writes forever, so it is skipped too."""
+    return comps[0] not in SKIPPED_COMMANDS and not (comps[0] == Commands.TAIL and "-f" in comps)
+
+
+class TraceRecorder:
+    """ Appends one JSON line per executed command to a trace file."""
+
+    def __init__(self, trace_path: str):
+        self.path = trace_path
+        self.num_records = 0
+        self._lock = threading.Lock()
+        self._file = open(trace_path, "a", buffering=1)  # Line buffered. A crash keeps the trace.
+
+    def record(self, env, comps: list[str]):
+        record = {
+            "ts": time.time(),
+            "drive": env.current_drive.name,
+            "pwd": env.present_working_dir.absolute_path,
+            "cmd": comps,
+        }
+        with self._lock:
+            self._file.write(json.dumps(record) + "\n")
+            self.num_records += 1
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+def read_trace(trace_path: str) -> list[dict]:
+    with open(trace_path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+class _SessionEnvironment(Environment):
+    """ An environment over session-local drives. Drives are not registered, so they are not pinned."""
+
+    def __init__(self, snapshots: dict):
+        super().__init__(enable_debug_logging=DebugLogger.enabled)
+        self._snapshots = snapshots
+        self._drives = {}
+
+    @Environment.current_drive.setter
+    def current_drive(self, drive: MemFileSystem):
+        self._current_drive = drive
+        self._pwd = drive.root
+
+    def mount_drive(self, drive_name: str):
+        """ Drives named in paths, e.g. cp movies archive:/, are session drives as well."""
+        return self._session_drive(drive_name), FileReturnCodes.SUCCESS
+
+    @contextmanager
+    def pinned(self, drive: MemFileSystem):
+        yield drive  # Session drives are not registered, so they are never evicted.
+
+    def _session_drive(self, drive_name: str) -> MemFileSystem:
+        """ Drives are created, or loaded from a snapshot, on first use."""
+        drive = self._drives.get(drive_name)
+        if drive is None:
+            if drive_name in self._snapshots:
+                drive = virtual_mem_drive_registry.load_image(self._snapshots[drive_name])
+                drive.name = drive_name
+            else:
+                drive = MemFileSystem(drive_name, register=False)
+            self._drives[drive_name] = drive
+        return drive
+
+    def switch_to(self, drive_name: str, pwd: str):
+        """ Sets the drive and pwd of a record."""
+        drive = self._session_drive(drive_name)
+        if drive is not self._current_drive:
+            self.current_drive = drive
+        pwd_dir, _ = drive.get_dir(drive.root, pwd)
+        self._pwd = pwd_dir or drive.root
+
+    def close(self):
+        """ Aborts open transactions and drops text indexes. Live indexes slow down writes to every drive."""
+        for drive in self._drives.values():
+            if drive.in_transaction:
+                drive.abort()
+            drive.disable_text_index()
+
+
+class ReplayReport:
+    """ Throughput and latency percentiles of a replay, per command type."""
+
+    def __init__(self, latencies: dict, errors: dict, num_skipped: int, wall_secs: float, num_sessions: int):
+        self.latencies = latencies  # command -> sorted latencies in seconds.
+        self.errors = errors  # command -> number of commands that raised.
+        self.num_skipped = num_skipped
+        self.wall_secs = wall_secs
+        self.num_sessions = num_sessions
+
+    @property
+    def num_commands(self) -> int:
+        return sum(len(latencies) for latencies in self.latencies.values())
+
+    @classmethod
+    def percentile(cls, sorted_values: list[float], fraction: float) -> float:
+        if not sorted_values:
+            return 0.0
+        return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+    def __str__(self) -> str:
+        lines = [f"Replayed {self.num_commands} commands in {self.num_sessions} session(s) in {self.wall_secs:.3f}s "
+                 f"({self.num_commands / self.wall_secs if self.wall_secs else 0:,.0f} commands/s). "
+                 f"Skipped {self.num_skipped}.",
+                 f"{'command':<14}{'count':>8}{'errors':>8}{'p50 us':>12}{'p99 us':>12}{'p999 us':>12}"]
+        for command, latencies in sorted(self.latencies.items()):
+            p50, p99, p999 = (1e6 * ReplayReport.percentile(latencies, q) for q in [0.5, 0.99, 0.999])
+            lines.append(f"{command:<14}{len(latencies):>8}{self.errors.get(command, 0):>8}"
+                         f"{p50:>12,.1f}{p99:>12,.1f}{p999:>12,.1f}")
+        return "\n".join(lines)
+
+
+def replay(records: list[dict], execute_fn, mode=MAX_SPEED, num_sessions=1, snapshots=None) -> ReplayReport:
+    """ Replays trace records in num_sessions concurrent sessions. Each session has its own drives.
+    Arguments:
+    records: trace records, see read_trace.
+    execute_fn: executes a command, fn(env, comps). Usually main.process_command.
+    mode: PACED keeps the original gaps between commands. MAX_SPEED issues them back to back.
+    snapshots: drive name -> image path. Drives without a snapshot start empty.
+    Output of the commands is discarded.
+    """
+    snapshots = snapshots or {}
+    replayed = [record for record in records if is_replayable(record["cmd"])]
+    results = [None] * num_sessions
+    start_barrier = threading.Barrier(num_sessions + 1)
+
+    def run_session(session_idx):
+        env = _SessionEnvironment(snapshots)
+        latencies, errors = {}, {}
+        start_barrier.wait()
+        start, trace_start = time.perf_counter(), replayed[0]["ts"] if replayed else 0
+        try:
+            for record in replayed:
+                if mode == PACED:
+                    delay = (record["ts"] - trace_start) - (time.perf_counter() - start)
+                    if delay > 0:
+                        time.sleep(delay)
+                env.switch_to(record["drive"], record["pwd"])
+                command = record["cmd"][0]
+                cmd_start = time.perf_counter()
+                try:
+                    execute_fn(env, record["cmd"])
+                except Exception:
+                    errors[command] = errors.get(command, 0) + 1
+                latencies.setdefault(command, []).append(time.perf_counter() - cmd_start)
+        finally:
+            env.close()
+        results[session_idx] = (latencies, errors)
+
+    threads = [threading.Thread(target=run_session, args=(i,)) for i in range(num_sessions)]
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        for thread in threads:
+            thread.start()
+        start_barrier.wait()
+        start = time.perf_counter()
+        for thread in threads:
+            thread.join()
+        wall_secs = time.perf_counter() - start
+
+    latencies, errors = {}, {}
+    for session_latencies, session_errors in results:
+        for command, values in session_latencies.items():
+            latencies.setdefault(command, []).extend(values)
+        for command, count in session_errors.items():
+            errors[command] = errors.get(command, 0) + count
+    for values in latencies.values():
+        values.sort()
+    return ReplayReport(latencies, errors, len(records) - len(replayed), wall_secs, num_sessions)
+
+
+if __name__ == "__main__":
+    import shutil
+    import tempfile
+    import tracemalloc
+    import main
+    import text_index
+    import watch
+    from logging_utils import CommandValidator
+
+    host_dir = tempfile.mkdtemp(prefix="toymemfs_trace_")
+    env = Environment.get_default()
+    main.process_command(env, ["mkdir", "movies"])
+    main.process_command(env, ["mk", "movies/nemo.txt"])
+    main.process_command(env, ["write", "movies/nemo.txt", "found nemo"])
+    main.process_command(env, ["export", "0", os.path.join(host_dir, "full.jsonl")])
+    archive = MemFileSystem("archive")
+    for name, content in [("script.txt", "new scripted\n"), ("manifest.txt", "scripted script.txt\n"),
+                          ("trace.jsonl", "")]:
+        with open(os.path.join(host_dir, name), "w") as f:
+            f.write(content)
+
+    # One record per command. Replays must leave the registry, host files and process-wide state as they were.
+    commands = [
+        ["ls"], ["mkdir", "movies"], ["mkdir", "shows"], ["mk", "shows/dory.txt"], ["write", "shows/dory.txt", "keep swimming"],
+        ["cat", "shows/dory.txt"], ["head", "shows/dory.txt"], ["tail", "shows/dory.txt"],
+        ["tail", "-f", "shows/dory.txt"], ["lines", "shows/dory.txt", "1", "1"], ["find", ".", "dory"],
+        ["index", "on"], ["search-text", "swimming"], ["cp", "shows", "/movies"], ["mv", "shows/dory.txt", "/"],
+        ["cp", "movies", "archive:/"], ["mv", "dory.txt", "archive:/movies"],
+        ["rm", "shows"], ["pwd"], ["cd", "movies"], ["help"], ["sys"], ["mem", "/"], ["echo", "hi"],
+        ["changes-since", "0"], ["import", os.path.join(host_dir, "full.jsonl")], ["begin"], ["commit"],
+        ["begin"], ["abort"], ["begin"],  # Left open. Closing the session aborts it.
+        ["mem-trace", "start"], ["watch", "start", "/"], ["trace", "start", os.path.join(host_dir, "t.jsonl")],
+        ["export", "0", os.path.join(host_dir, "replayed.jsonl")],
+        ["replay", os.path.join(host_dir, "trace.jsonl")], ["load", os.path.join(host_dir, "script.txt")],
+        ["load-all", os.path.join(host_dir, "manifest.txt"), "0"], ["new", "scratch"], ["attach", "x", host_dir],
+        ["mount", "scratch"], ["drives"], ["unmount", "default"], ["drop", "default"], ["exit"],
+    ]
+    assert {cmd[0] for cmd in commands} == set(CommandValidator.commands) | {Commands.EXIT}, \
+        "Add new commands to this trace and to SKIPPED_COMMANDS if they reach outside the session."
+    records = [{"ts": time.time(), "drive": "default", "pwd": "/", "cmd": cmd} for cmd in commands]
+
+    def state():
+        return (virtual_mem_drive_registry.drive_names(), env.current_drive.generation, archive.generation,
+                sorted(os.listdir(host_dir)), tracemalloc.is_tracing(), watch.active_subscriptions,
+                text_index.active_indexes)
+
+    before = state()
+    report = replay(records, main.process_command, num_sessions=2)
+    assert state() == before, (state(), before)
+    assert report.num_skipped == len([cmd for cmd in commands if not is_replayable(cmd)])
+    assert not report.errors, report.errors
+    assert {"export", "load-all", "mem-trace", "watch", "trace", "new", "exit"}.isdisjoint(report.latencies)
+    assert {"import", "index", "begin", "cp", "mv"} <= set(report.latencies)
+    shutil.rmtree(host_dir)
+    print("command_trace: all checks passed.")
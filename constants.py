@@ -10,18 +10,39 @@ class Commands:
     MKDIR = "mkdir"
     MK = "mk"
     MVFILE = "mv"
+    CP = "cp"
     FIND = "find"
+    SEARCH_TEXT = "search-text"
+    INDEX = "index"
     WRITE = "write"
     CAT = "cat"
+    HEAD = "head"
+    TAIL = "tail"
+    LINES = "lines"
     RM = "rm"
     PWD = "pwd"
     CD = "cd"
     HELP = "help"
     SYS = "sys"
+    MEM = "mem"
+    MEM_TRACE = "mem-trace"
     LOAD = "load"
+    LOAD_ALL = "load-all"
+    TRACE = "trace"
+    WATCH = "watch"
+    REPLAY = "replay"
+    BEGIN = "begin"
+    COMMIT = "commit"
+    ABORT = "abort"
+    CHANGES_SINCE = "changes-since"
+    EXPORT = "export"
+    IMPORT = "import"
     NEW = "new"
     MOUNT = "mount"
     DRIVES = "drives"
+    UNMOUNT = "unmount"
+    DROP = "drop"
+    ATTACH = "attach"
     ECHO = "echo"
     EXIT = "exit"
     UNKNOWN = "Unknown. Type help for a complete list or exit to terminate."
@@ -1,22 +1,36 @@
 """ Content Files for In-MEM filesystem."""
-from io import StringIO
+from array import array
+from bisect import bisect_left
+from io import StringIO, SEEK_END
 from base_file import FileType, BaseFile
 from directory import Directory
 from file_return_codes import FileReturnCodes
 from file_extension_registry import register_file_ext
+import generations
+import text_index
+import watch
 import re
+import sys
+import threading
 
 
 @register_file_ext(ext="txt")
 class TextFile(BaseFile):
     """ Supports plain text files with txt extension.
+    Readers seek the shared buffer, so reads and writes take a per-file lock. A follower can read while
+    another thread appends.
+    copy() is copy-on-write: the source and its copies share one immutable snapshot of the text and its line
+    index. Each file gets its own buffer on its first write.
     """
 
     # Config args supported by this type.
     _default_config = {
-        "write_mode": "overwrite"  # supported: overwrite | append
+        "write_mode": "overwrite",  # supported: overwrite | append
+        "end": "\n"  # appended after the content.
     }
 
+    _newline_re = re.compile("\n")
+
     def __init__(self, name: str, parent: Directory):
         """ Initialize a text file.
         Arguments:
@@ -24,49 +38,391 @@ class TextFile(BaseFile):
         parent: Directory that holds this file.
         """
         super().__init__(name, FileType.TEXT_FILE, parent)
-        self._content = StringIO()  # For supporting efficient appends.
+        self._content = StringIO()  # For supporting efficient appends. None while the text is shared.
+        self._shared = None  # Text shared with copies. Set while _content is None.
+        # Offsets of all newlines. Line i spans [start of line i, offset of its newline].
+        self._newlines = array("q")
+        # Guards the position of _content and the line index.
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        """ StringIO and locks are not picklable. Persist the text instead. The line index is rebuilt on load."""
+        state = self.__dict__.copy()
+        if self._content is not None:
+            state["_content"] = self._content.getvalue()
+        del state["_newlines"]
+        state.pop("_lock", None)
+        return state
+
+    def __setstate__(self, state):
+        """ Shared text is pickled once per image and stays shared after loading."""
+        self.__dict__.update(state)
+        self.__dict__.setdefault("_shared", None)  # Images saved before copies were shared.
+        if self._content is not None:
+            self._content = StringIO(state["_content"])
+            self._content.seek(0, SEEK_END)
+        self._newlines = array("q")
+        self._lock = threading.Lock()
+        self._index_lines(self.getvalue(), 0)
 
     def __iter__(self):
-        self._content.flush()
-        return iter(self._content)
+        """ Iterates over the lines of the file."""
+        return (self.read_lines(line, line + 1) for line in range(self.line_count()))
+
+    def __len__(self):
+        """ Returns the number of characters in the file."""
+        with self._lock:
+            return self._length()
 
     def is_empty(self):
-        return len(self._content) == 0
+        return len(self) == 0
 
     def add_content(self, content, **kwargs):
         """ Adds text content to the file. We either append or overwrite.
         """
         config = TextFile._default_config
         if kwargs:
-            config.update(kwargs)
-        if config["write_mode"] != "append":
-            self._content.truncate(0) #overwrite.
-        self._content.writelines([content, "\n"])
+            config = {**config, **kwargs}
+        with self._lock:
+            self._own_buffer()
+            if config["write_mode"] != "append":
+                self._content.seek(0)
+                self._content.truncate(0) #overwrite.
+                del self._newlines[:]
+            offset = self._content.seek(0, SEEK_END)  # A reader may have moved the position.
+            self._content.writelines([content, config["end"]])
+            self._index_lines(content, offset)
+            self._index_lines(config["end"], offset + len(content))
+        generations.touch(self)
+        if text_index.active_indexes:
+            text_index.on_write(self, content + config["end"], append=config["write_mode"] == "append")
+        if watch.active_subscriptions:
+            watch.notify(self, watch.WRITE)
+
+    def truncate(self, size: int):
+        """ Truncates the file to size characters. Used to undo appends."""
+        with self._lock:
+            self._own_buffer()
+            self._content.truncate(size)
+            self._content.seek(0, SEEK_END)
+            del self._newlines[bisect_left(self._newlines, size):]
+        generations.touch(self)
+        if text_index.active_indexes:
+            text_index.on_write(self, self.getvalue(), append=False)
+        if watch.active_subscriptions:
+            watch.notify(self, watch.WRITE)
+
+    def getvalue(self) -> str:
+        with self._lock:
+            return self._shared if self._content is None else self._content.getvalue()
+
+    def _length(self) -> int:
+        return len(self._shared) if self._content is None else self._content.seek(0, SEEK_END)
+
+    def _own_buffer(self):
+        """ Gives the file its own buffer and line index before it is written. Called with the lock held."""
+        if self._content is None:
+            self._content = StringIO(self._shared)
+            self._content.seek(0, SEEK_END)
+            self._newlines = array("q", self._newlines)
+            self._shared = None
+
+    def line_count(self) -> int:
+        """ Returns the number of lines. A last line without a newline counts as a line."""
+        with self._lock:
+            return self._line_count()
+
+    def _line_count(self) -> int:
+        complete = len(self._newlines)
+        last_end = self._newlines[-1] + 1 if complete else 0
+        return complete + (1 if self._length() > last_end else 0)
+
+    def complete_line_count(self) -> int:
+        """ Returns the number of lines that end with a newline."""
+        return len(self._newlines)
+
+    def read_lines(self, start: int, end: int) -> str:
+        """ Returns lines [start, end) (0-based) including their newlines. Only the requested
+        characters are read. Negative values count from the end, like slices.
+        """
+        with self._lock:
+            start, end, _ = slice(start, end).indices(self._line_count())
+            if start >= end:
+                return ""
+            first = self._newlines[start - 1] + 1 if start else 0
+            last = self._newlines[end - 1] + 1 if end <= len(self._newlines) else self._length()
+            if self._content is None:
+                return self._shared[first:last]
+            self._content.seek(first)
+            text = self._content.read(last - first)
+            self._content.seek(0, SEEK_END)
+            return text
+
+    def head(self, num_lines: int) -> str:
+        return self.read_lines(0, num_lines)
+
+    def tail(self, num_lines: int) -> str:
+        if num_lines <= 0:
+            return ""
+        return self.read_lines(-num_lines, sys.maxsize)
+
+    def _index_lines(self, text: str, offset: int):
+        """ Adds the newlines of text, written at offset, to the line index."""
+        if "\n" in text:
+            self._newlines.extend(m.start() + offset for m in TextFile._newline_re.finditer(text))
 
     def move(self, new_parent: Directory):
         if self.name in new_parent:
             return FileReturnCodes.ALREADY_EXIST
-        self.parent.remove_child(self.name)
-        new_parent.add_content(self)
+        # The drive publishes a single move event.
+        self.parent.remove_child(self.name, notify=False)
+        new_parent.add_content(self, notify=False)
         return FileReturnCodes.SUCCESS
 
+    def copy(self):
+        """ Returns a copy that shares the text. The source gives up its buffer for the shared snapshot,
+        which is stored in one byte per character for ASCII text instead of four.
+        """
+        file_copy = TextFile(self.name, parent=None)
+        with self._lock:
+            if self._content is not None:
+                self._shared, self._content = self._content.getvalue(), None
+            file_copy._shared, file_copy._newlines, file_copy._content = self._shared, self._newlines, None
+        return file_copy
+
     def search(self, regex_str, **kwargs):
         matcher = re.compile(regex_str)
-        return matcher.findall(self._content.getvalue())
+        return matcher.findall(self.getvalue())
+
+    def __str__(self) -> str:
+        return self.getvalue()
+
+    def delete(self) -> int:
+        # Content is not closed. A deleted file can be restored by a transaction abort.
+        if self.parent:
+            self.parent.remove_child(self.name)
+        return FileReturnCodes.SUCCESS
+
+
+class BinaryFile(BaseFile):
+    """ Supports binary files such as images and serialized models. Content is stored in a bytearray.
+    Ranged reads return memoryview slices, so data can be handed to sockets or mmap consumers without copies.
+    getbuffer() returns a view of the whole content. On Python 3.12+, memoryview(file) works as well.
+    Note: like io.BytesIO, the file cannot be resized while an exported view is alive.
+    copy() is copy-on-write between copies: a copy holds immutable bytes, shared with the copies made from it,
+    until its first write. The source keeps its bytearray, so views exported from it stay valid.
+    """
+
+    # Extensions registered at import. More can be added with register_binary_extensions.
+    default_extensions = ("bin", "dat", "png", "gif", "pdf", "pkl")
+
+    # Config args supported by this type.
+    _default_config = {
+        "write_mode": "overwrite",  # supported: overwrite | append
+        "end": b""  # appended after the content.
+    }
+
+    # Size of the chunks returned by __iter__.
+    _chunk_size = 64 * 1024
+
+    def __init__(self, name: str, parent: Directory):
+        super().__init__(name, FileType.BINARY_FILE, parent)
+        self._data = bytearray()
+
+    def __iter__(self):
+        """ Iterates over the content in memoryview chunks."""
+        view = memoryview(self._data)
+        return (view[i:i + BinaryFile._chunk_size] for i in range(0, len(view), BinaryFile._chunk_size))
+
+    def __len__(self):
+        """ Returns the number of bytes in the file."""
+        return len(self._data)
+
+    if sys.version_info >= (3, 12):  # Python classes can only export buffers from 3.12 (PEP 688).
+        def __buffer__(self, flags):
+            """ Buffer protocol. memoryview(file) exposes the content without copying."""
+            self._own_data()
+            return memoryview(self._data)
+
+    def is_empty(self):
+        return len(self) == 0
+
+    def getbuffer(self) -> memoryview:
+        """ Returns a writable view over the whole content without copying."""
+        self._own_data()
+        return memoryview(self._data)
+
+    def getvalue(self) -> bytes:
+        return bytes(self._data)
+
+    def read(self, offset=0, size=-1) -> memoryview:
+        """ Returns a zero-copy view of size bytes starting at offset. size=-1 reads to the end.
+        The view is read-only while the content is shared with copies.
+        """
+        end = len(self._data) if size < 0 else offset + size
+        return memoryview(self._data)[offset:end]
+
+    def write(self, data, offset: int) -> int:
+        """ Writes data in place at offset. The file grows if needed. Gaps are filled with zeros."""
+        self._own_data()
+        if offset > len(self._data):
+            self._data.extend(bytes(offset - len(self._data)))
+        self._data[offset:offset + len(data)] = data
+        generations.touch(self)
+        if watch.active_subscriptions:
+            watch.notify(self, watch.WRITE)
+        return len(data)
+
+    def add_content(self, content, **kwargs):
+        """ Appends or overwrites content. content is bytes-like or str (stored as utf-8).
+        """
+        config = BinaryFile._default_config
+        if kwargs:
+            config = {**config, **kwargs}
+        self._own_data()
+        if config["write_mode"] != "append":
+            del self._data[:]  # overwrite.
+        for data in [content, config["end"]]:
+            self._data += data.encode() if isinstance(data, str) else data
+        generations.touch(self)
+        if watch.active_subscriptions:
+            watch.notify(self, watch.WRITE)
+
+    def truncate(self, size: int):
+        """ Truncates the file to size bytes."""
+        self._own_data()
+        del self._data[size:]
+        generations.touch(self)
+        if watch.active_subscriptions:
+            watch.notify(self, watch.WRITE)
+
+    def move(self, new_parent: Directory):
+        if self.name in new_parent:
+            return FileReturnCodes.ALREADY_EXIST
+        # The drive publishes a single move event.
+        self.parent.remove_child(self.name, notify=False)
+        new_parent.add_content(self, notify=False)
+        return FileReturnCodes.SUCCESS
+
+    def _own_data(self):
+        """ Gives a copy its own bytearray before it is written or a writable view is exported."""
+        if not isinstance(self._data, bytearray):
+            self._data = bytearray(self._data)
+
+    def copy(self):
+        file_copy = BinaryFile(self.name, parent=None)
+        file_copy._data = bytes(self._data)  # No copy if the content is already shared.
+        return file_copy
+
+    def search(self, regex, **kwargs):
+        """ Searches the content. regex is a bytes pattern or a str (encoded as utf-8)."""
+        if isinstance(regex, str):
+            regex = regex.encode()
+        return re.compile(regex).findall(self._data)
 
     def __str__(self) -> str:
-        return self._content.getvalue()
+        return f"<binary file: {len(self._data)} bytes>"
 
     def delete(self) -> int:
-        self._content.close()
         if self.parent:
             self.parent.remove_child(self.name)
         return FileReturnCodes.SUCCESS
 
 
+def register_binary_extensions(*extensions):
+    """ Registers BinaryFile as the handler for additional extensions."""
+    for ext in extensions:
+        register_file_ext(ext=ext)(BinaryFile)
+
+
+register_binary_extensions(*BinaryFile.default_extensions)
+
+
 # TODO(maryamq): Testing. delete later.
 if __name__ == "__main__":
     test_file = TextFile("test", parent=None)
     test_file.add_content("Hello World")
     print(test_file)
     print("Searching: ", test_file.search("World"))
+    blob = BinaryFile("blob.bin", parent=None)
+    blob.add_content(b"hello binary")
+    blob.write(b"HELLO", 0)
+    print(blob, blob.read(6, 6).tobytes(), blob.search(rb"H\w+"))
+    # Reads are views of the live content, not copies.
+    with blob.read(0, 5) as view:
+        assert view.tobytes() == b"HELLO"
+        view[0:1] = b"J"
+    assert blob.getvalue() == b"JELLO binary"
+    with blob.getbuffer() as view:
+        assert view.nbytes == len(blob) and not view.readonly
+    # Writes past the end fill the gap with zeros. Appends keep the content.
+    blob.write(b"!", 14)
+    assert blob.getvalue() == b"JELLO binary\x00\x00!"
+    blob.add_content("\u00e9", write_mode="append")
+    assert blob.getvalue().endswith("\u00e9".encode()) and len(blob) == 17
+    BinaryFile._chunk_size = 4
+    assert b"".join(chunk.tobytes() for chunk in blob) == blob.getvalue()
+    BinaryFile._chunk_size = 64 * 1024
+    blob.truncate(5)
+    assert blob.getvalue() == b"JELLO"
+    if sys.version_info >= (3, 12):
+        assert memoryview(blob).tobytes() == b"JELLO"
+    # Copies share content until they are written.
+    blob_copy = blob.copy()
+    copy_of_copy = blob_copy.copy()
+    assert copy_of_copy._data is blob_copy._data and blob_copy.read(0, 5).readonly
+    copy_of_copy.write(b"Y", 0)
+    assert (blob.getvalue(), blob_copy.getvalue(), copy_of_copy.getvalue()) == (b"JELLO", b"JELLO", b"YELLO")
+    with blob_copy.getbuffer() as view:
+        assert not view.readonly and blob_copy._data is not copy_of_copy._data
+    print("BinaryFile checks passed.")
+    import pickle
+    text = TextFile("text.txt", parent=None)
+    text.add_content("one\ntwo")
+    text_copy = text.copy()
+    assert text_copy._shared is text._shared and text_copy._newlines is text._newlines
+    assert text_copy.read_lines(1, 2) == "two\n" and text_copy.tail(1) == "two\n" and text_copy.line_count() == 2
+    text.add_content("three", write_mode="append")
+    text_copy.add_content("2", write_mode="append")
+    assert (text.getvalue(), text_copy.getvalue()) == ("one\ntwo\nthree\n", "one\ntwo\n2\n")
+    assert (text.line_count(), text_copy.line_count()) == (3, 3)
+    # Images keep the sharing.
+    copies = [text.copy() for _ in range(3)]
+    loaded = pickle.loads(pickle.dumps(copies))
+    assert loaded[0]._shared is loaded[2]._shared and loaded[1].read_lines(2, 3) == "three\n"
+    print("Copy-on-write checks passed.")
+    # Reads seek the shared buffer while another thread appends. Appends must still land at the end.
+    log = TextFile("log.txt", parent=None)
+    num_lines = 20000
+    expected = [f"line {i}\n" for i in range(num_lines)]
+
+    def append_lines(file, lines):
+        for line in lines:
+            file.add_content(line[:-1], write_mode="append")
+
+    sys.setswitchinterval(1e-6)  # Switch threads often to expose races.
+    writer = threading.Thread(target=append_lines, args=(log, expected))
+    writer.start()
+    while writer.is_alive():
+        num_written = log.line_count()
+        last = log.tail(1)
+        assert not num_written or re.fullmatch(r"line \d+\n", last), last
+        log.head(2), log.read_lines(5, 8), len(log)
+    writer.join()
+    assert log.line_count() == num_lines and log.getvalue() == "".join(expected)
+    assert all(log.read_lines(i, i + 1) == expected[i] for i in range(0, num_lines, 997))
+    # A follower receives every appended line exactly once, and stops once writes stop.
+    from mem_fs import MemFileSystem
+    drive = MemFileSystem("follow_test", register=False)
+    drive.make_file(drive.root, "/app.txt", FileType.TEXT_FILE)
+    app_log, _ = drive.get_file(drive.root, "/app.txt")
+    app_log.add_content(expected[0][:-1], write_mode="append")
+    follower = drive.follow(drive.root, "/app.txt", num_lines=num_lines, timeout=1)
+    followed = [next(follower)]  # The follower has subscribed once it yields the first line.
+    writer = threading.Thread(target=append_lines, args=(app_log, expected[1:]))
+    writer.start()
+    followed.extend(follower)
+    writer.join()
+    assert followed == expected, (len(followed), followed[:3])
+    sys.setswitchinterval(0.005)
+    print("Concurrent TextFile checks passed.")
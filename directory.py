@@ -2,6 +2,9 @@ from base_file import FileType, BaseFile
 from file_return_codes import FileReturnCodes
 import re
 from file_extension_registry import register_file_ext
+import generations
+import text_index
+import watch
 
 
 @register_file_ext(ext="") # No extension = directory.
@@ -9,6 +12,11 @@ class Directory(BaseFile):
     """ Represents a directory in the in memory filesystem.
     """
 
+    # The MemFileSystem that owns this directory. Only set on the root directory of a drive.
+    owner_drive = None
+    # Child name -> generation at which the child was detached. Created on the first detach.
+    tombstones = None
+
     def __init__(self, name, parent=None):
         super().__init__(name, FileType.DIR, parent)
         self._children = {}
@@ -16,6 +24,9 @@ class Directory(BaseFile):
     def __iter__(self):
         return iter(self._children.values())
 
+    def __contains__(self, child_name: str) -> bool:
+        return child_name in self._children
+
     def is_empty(self) -> bool:
         return len(self._children) == 0
 
@@ -28,22 +39,33 @@ class Directory(BaseFile):
     def get_child(self, child: str):
         return self._children[child]
 
-    def add_content(self, child: BaseFile, **kwargs):
+    def add_content(self, child: BaseFile, notify=True, **kwargs):
         if self.has_child(child.name):
             return FileReturnCodes.ALREADY_EXIST
         self._children[child.name] = child
         child.parent = self
+        generations.on_attach(self, child)
+        # notify is False when a file is moved within the drive. The indexes stay valid in that case.
+        if notify and text_index.active_indexes:
+            text_index.on_attach(child)
+        if notify and watch.active_subscriptions:
+            watch.notify(child, watch.CREATE)
         return FileReturnCodes.SUCCESS
 
     def children_names(self):
         return self._children.keys()
 
-    def remove_child(self, child_name, force_del=False):
+    def remove_child(self, child_name, force_del=False, notify=True):
         if child_name in self._children:
             child = self._children[child_name]
             if not force_del and Directory.IsDirectory(child) and len(child) > 1:
                 return FileReturnCodes.INVALID_PATH
+            if notify and text_index.active_indexes:
+                text_index.on_detach(self, child)
+            if notify and watch.active_subscriptions:
+                watch.notify(child, watch.DELETE)
             del self._children[child_name]
+            generations.on_detach(self, child)
             return FileReturnCodes.SUCCESS
         return FileReturnCodes.DELETE_FAILED
 
@@ -62,10 +84,23 @@ class Directory(BaseFile):
         # Check if the dir already exists.
         if self.name in new_parent:
             return FileReturnCodes.ALREADY_EXIST
-        self.parent.remove_child(self.name)
-        new_parent.add_content(self)
+        # The drive publishes a single move event.
+        self.parent.remove_child(self.name, notify=False)
+        new_parent.add_content(self, notify=False)
         return FileReturnCodes.SUCCESS
 
+    def copy(self):
+        """ Returns a detached copy of the subtree. Copies are linked directly, without the attach hooks.
+        They run once when the copy is attached. Children that cannot be copied are skipped.
+        """
+        dir_copy = Directory(self.name)
+        for child in self._children.values():
+            child_copy = child.copy()
+            if child_copy is not None:
+                child_copy.parent = dir_copy
+                dir_copy._children[child_copy.name] = child_copy
+        return dir_copy
+
     def delete(self) -> int:
         """ Deletes the file. """
         if self.is_empty() and self.parent:
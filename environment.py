@@ -1,4 +1,6 @@
+from contextlib import contextmanager
 from directory import Directory
+import virtual_mem_drive_registry
 from mem_fs import MemFileSystem
 from logging_utils import DebugLogger
 
@@ -8,16 +10,22 @@ class Environment:
     """
     _DEFAULT_PROMPT = ">"
 
-    def __init__(self, enable_debug_logging=True):
+    def __init__(self, enable_debug_logging=False):
         """ Initializes user's environment."""
         DebugLogger.enabled = enable_debug_logging
         self._current_drive = None
         # TODO(maryamq): maybe this should belong to individual in-mem drive.
         self._pwd = None
+        # Set by trace start. Records every processed command.
+        self.trace_recorder = None
+        # Set by watch start. Change events of the current drive.
+        self.watch_subscription = None
+        # Set by mem-trace start. Attributes allocations to drive operations.
+        self.allocation_profiler = None
         self._logger = DebugLogger.get_logger_fn("Environment")
 
     @classmethod
-    def get_default(cls, enable_debug_logging=True):
+    def get_default(cls, enable_debug_logging=False):
         """Creates a default environment."""
         env = Environment(enable_debug_logging)
         env.current_drive = MemFileSystem("default")
@@ -31,7 +39,10 @@ class Environment:
 
     @current_drive.setter
     def current_drive(self, drive: MemFileSystem):
-        """ Sets the current drive."""
+        """ Sets the current drive. The mounted drive is pinned so that it is never evicted."""
+        virtual_mem_drive_registry.pin(drive.name)
+        if self._current_drive:
+            virtual_mem_drive_registry.unpin(self._current_drive.name)
         self._current_drive = drive
         self._pwd = self._current_drive.root
 
@@ -53,3 +64,17 @@ class Environment:
             return Environment._DEFAULT_PROMPT
         return f"{self._current_drive.name}>"
 
+    def mount_drive(self, drive_name: str):
+        """ Returns the drive named by a path such as test:/movies.
+        Returns: (drive, return code)
+        """
+        return virtual_mem_drive_registry.mount(drive_name)
+
+    @contextmanager
+    def pinned(self, drive: MemFileSystem):
+        """ Keeps a drive resident while a command mounts other drives."""
+        virtual_mem_drive_registry.pin(drive.name)
+        try:
+            yield drive
+        finally:
+            virtual_mem_drive_registry.unpin(drive.name)
@@ -2,12 +2,16 @@
 Methods for registring file extensions. 
 Suclasses of BaseFile can register themselves as handlers of particular extensions. 
 This allows the FS to scale support for new types dynamically without requiring any other code changes. 
+Plugin modules listed in _plugin_modules are imported, and so register their types, on first use.
 """
+import importlib
 from logging_utils import DebugLogger
 from file_return_codes import FileReturnCodes
 from base_file import BaseFile
 
 _extension_registry = {}
+# Modules that register file types when imported. They are imported when an extension is first missing.
+_plugin_modules = ["content_files"]
 _logger = DebugLogger.get_logger_fn("ExtRegistry")
 
 
@@ -19,20 +23,35 @@ def register_file_ext(ext: str):
             _logger(f"Warning: Overwriting {ext} with {class_initializer}")
         assert issubclass(type(class_initializer), type(BaseFile))
         _extension_registry[ext] = class_initializer
-        _logger(f"Successfully Registered {class_initializer}")
         return class_initializer
     return reg_fn
 
 
+def register_plugin_module(module_name: str):
+    """ Adds a module that registers file types. It is imported on first use."""
+    if module_name not in _plugin_modules:
+        _plugin_modules.append(module_name)
+
+
+def _load_plugins():
+    while _plugin_modules:
+        importlib.import_module(_plugin_modules.pop(0))
+
+
+def get_extension(filename: str) -> str:
+    """ Returns the extension of filename. Empty for directories."""
+    # TODO(maryamq): hacky
+    comps = filename.split(".")
+    return comps[-1] if len(comps) > 1 else ""
+
+
 def file_creator_factory(filename, parent, *args, **kwargs):
     """
     Initializes a BaseFile subclasses based on the extension. 
     """
-    # TODO(maryamq): hacky
-    comps = filename.split(".")
-    ext = ""
-    if len(comps) > 1:
-        ext = comps[-1]
+    ext = get_extension(filename)
+    if ext not in _extension_registry and _plugin_modules:
+        _load_plugins()
     if ext not in _extension_registry:
         _logger(f"Unsupported extension: ", ext)
         return None, FileReturnCodes.UNSUPPORTED
@@ -1,5 +1,7 @@
 """ Class to encapsulate return codes from our filesystem.
+Also contains typed exceptions for the programmatic API (see mem_os.py).
 """
+import errno
 
 
 class FileReturnCodes:
@@ -41,16 +43,64 @@ class FileReturnCodes:
             FileReturnCodes.template_defaults.update(kw_defaults)
 
     @classmethod
-    def print_message(cls, return_code, **kwargs) -> str:
+    def message(cls, return_code, **kwargs) -> str:
         """ Generates an error message using the error code and kwargs.
          Arguments:
           return_code: int to represent a error code. 
           kwargs: string key-value args to populate the error template.
         """
-        dict_args = FileReturnCodes.template_defaults.copy()
-        dict_args.update(kwargs)
-        print(FileReturnCodes._error_tmpl[return_code].format(
-            **dict_args).strip())
+        dict_args = {**FileReturnCodes.template_defaults, **kwargs}
+        return FileReturnCodes._error_tmpl[return_code].format(**dict_args).strip()
+
+    @classmethod
+    def print_message(cls, return_code, **kwargs):
+        """ Prints the message for return_code. See message()."""
+        print(FileReturnCodes.message(return_code, **kwargs))
+
+    @classmethod
+    def raise_for_code(cls, return_code, name=""):
+        """ Raises the typed exception for return_code. Does nothing on SUCCESS.
+        The exception message is only formatted if the caller asks for it (e.g. str(e)).
+        """
+        if return_code == FileReturnCodes.SUCCESS:
+            return
+        exc_type, err_no = _exceptions.get(return_code, (MemFSError, errno.EIO))
+        raise exc_type(err_no, exc_type.default_strerror, name)
+
+
+class MemFSError(OSError):
+    """ Base class for errors raised by the programmatic API."""
+    return_code = None
+    default_strerror = "In-mem filesystem error"
+
+
+class AlreadyExistsError(MemFSError, FileExistsError):
+    return_code = FileReturnCodes.ALREADY_EXIST
+    default_strerror = "Already exists"
+
+
+class InvalidPathError(MemFSError, FileNotFoundError):
+    return_code = FileReturnCodes.INVALID_PATH
+    default_strerror = "Invalid path"
+
+
+class DeleteFailedError(MemFSError):
+    return_code = FileReturnCodes.DELETE_FAILED
+    default_strerror = "Deletion failed"
+
+
+class UnsupportedError(MemFSError):
+    return_code = FileReturnCodes.UNSUPPORTED
+    default_strerror = "Unsupported"
+
+
+# Return code -> (exception type, errno).
+_exceptions = {
+    FileReturnCodes.ALREADY_EXIST: (AlreadyExistsError, errno.EEXIST),
+    FileReturnCodes.INVALID_PATH: (InvalidPathError, errno.ENOENT),
+    FileReturnCodes.DELETE_FAILED: (DeleteFailedError, errno.ENOTEMPTY),
+    FileReturnCodes.UNSUPPORTED: (UnsupportedError, errno.ENOTSUP),
+}
 
 
 # TODO(maryamq): Testing.. to be deleted.
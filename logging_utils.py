@@ -38,20 +38,41 @@ class CommandValidator:
     commands = {
         Commands.LS: Command(name=Commands.LS, validators_fns=[ArgValidators.get_min_max_fn(min_value=1, max_value=2)], description="Lists all files in the current or specified directory.", usage="ls <enter> or ls <path>"),
         Commands.MKDIR: Command(name=Commands.MKDIR, validators_fns=[ArgValidators.get_min_max_fn(min_value=2, max_value=2)], description="Creates a new directory.", usage="mkdir <path>"),
-        Commands.MK: Command(name=Commands.MK, validators_fns=[ArgValidators.get_min_max_fn(min_value=2, max_value=2)], description="Creates a directory or a text file. Only .txt extension in supported.", usage="mk mydir or mk myfile.txt"),
-        Commands.MVFILE: Command(name=Commands.MVFILE, validators_fns=[ArgValidators.get_min_max_fn(min_value=3, max_value=3)], description="Moves a file to a new directory.", usage="mv <old_path> <new_path>"),
+        Commands.MK: Command(name=Commands.MK, validators_fns=[ArgValidators.get_min_max_fn(min_value=2, max_value=2)], description="Creates a directory, a text file (.txt) or a binary file (.bin, .dat, .png, .gif, .pdf, .pkl).", usage="mk mydir, mk myfile.txt or mk image.png"),
+        Commands.MVFILE: Command(name=Commands.MVFILE, validators_fns=[ArgValidators.get_min_max_fn(min_value=3, max_value=3)], description="Moves a file to a new directory. Paths can name a drive, e.g. test:/movies, to move across drives.", usage="mv <old_path> <new_dir> or mv movies archive:/old"),
+        Commands.CP: Command(name=Commands.CP, validators_fns=[ArgValidators.get_min_max_fn(min_value=3, max_value=3)], description="Copies a file or directory to a new directory. Paths can name a drive, e.g. test:/movies.", usage="cp <path> <new_dir> or cp movies archive:/"),
         Commands.FIND: Command(name=Commands.FIND, validators_fns=[ArgValidators.get_min_max_fn(min_value=3, max_value=None)], description="Search for dir or in a text file.", usage="find . regex or find <path> regex. Use ^term$ for exact match."),
+        Commands.SEARCH_TEXT: Command(name=Commands.SEARCH_TEXT, validators_fns=[ArgValidators.get_min_max_fn(min_value=2, max_value=None)], description="Finds text files that contain all terms. Use OR for any term and quotes for phrases. Requires index on.", usage="search-text nemo dory or search-text nemo OR dory or search-text \"found nemo\""),
+        Commands.INDEX: Command(name=Commands.INDEX, validators_fns=[ArgValidators.get_min_max_fn(min_value=2, max_value=2)], description="Enables, disables or reports the full-text index of the current drive.", usage="index on, index off or index stats"),
         Commands.WRITE: Command(name=Commands.WRITE, validators_fns=[ArgValidators.get_min_max_fn(min_value=3, max_value=None)], description="Append or overwrite to an existing file.", usage="write <path> [-a] 'content'"),
         Commands.CAT: Command(name=Commands.CAT, validators_fns=[ArgValidators.get_min_max_fn(min_value=2, max_value=2)], description="Output file content.", usage="cat <path>"),
+        Commands.HEAD: Command(name=Commands.HEAD, validators_fns=[ArgValidators.get_min_max_fn(min_value=2, max_value=4)], description="Output the first lines of a text file. Defaults to 10 lines.", usage="head <path> or head -n 5 <path>"),
+        Commands.TAIL: Command(name=Commands.TAIL, validators_fns=[ArgValidators.get_min_max_fn(min_value=2, max_value=7)], description="Output the last lines of a text file. -f keeps printing appended lines until Ctrl-C, or until no write arrives for 10 seconds (-t to change).", usage="tail <path>, tail -n 5 <path>, tail -f <path> or tail -f -t 2 <path>"),
+        Commands.LINES: Command(name=Commands.LINES, validators_fns=[ArgValidators.get_min_max_fn(min_value=4, max_value=4)], description="Output a range of lines of a text file. Lines are numbered from 1 and the range is inclusive.", usage="lines <path> <start> <end>"),
         Commands.RM: Command(name=Commands.RM, validators_fns=[ArgValidators.get_min_max_fn(min_value=2, max_value=2)], description="Removes a file or directory. Directories must be empty.", usage="rm <path>"),
         Commands.PWD: Command(name=Commands.PWD, validators_fns=[ArgValidators.get_min_max_fn(min_value=1, max_value=1)], description="Prints the present working directory.", usage="pwd <enter>"),
         Commands.CD: Command(name=Commands.CD, validators_fns=[ArgValidators.get_min_max_fn(min_value=2, max_value=2)], description="Change present working directory.", usage="cd <dir>"),
         Commands.HELP: Command(name=Commands.HELP, validators_fns=[ArgValidators.get_min_max_fn(min_value=1, max_value=2)], description="Get Help.", usage="help <enter> or help <command>"),
         Commands.SYS: Command(name=Commands.SYS, validators_fns=[ArgValidators.get_min_max_fn(min_value=1, max_value=1)], description="Prints out all files in the drive. ", usage="sys <enter>"),
+        Commands.LOAD_ALL: Command(name=Commands.LOAD_ALL, validators_fns=[ArgValidators.get_min_max_fn(min_value=2, max_value=3)], description="Runs the scripts of a manifest (lines of: drive script_path). Drives are loaded concurrently in worker processes. 0 workers loads them one by one.", usage="load-all <manifest> or load-all <manifest> 4"),
+        Commands.WATCH: Command(name=Commands.WATCH, validators_fns=[ArgValidators.get_min_max_fn(min_value=2, max_value=3)], description="Subscribes to changes under a path of the current drive. events prints and clears the queued events. Bursts of writes to a file show as one event with a count.", usage="watch start /movies, watch events or watch stop"),
+        Commands.MEM: Command(name=Commands.MEM, validators_fns=[ArgValidators.get_min_max_fn(min_value=2, max_value=3)], description="Estimates the memory used under a path by type and component, with the largest files and directories. Defaults to the top 10.", usage="mem / or mem movies 5"),
+        Commands.MEM_TRACE: Command(name=Commands.MEM_TRACE, validators_fns=[ArgValidators.get_min_max_fn(min_value=2, max_value=3)], description="Traces allocations with tracemalloc and reports the live bytes allocated by each drive operation since start.", usage="mem-trace start or mem-trace stop or mem-trace stop 5"),
         Commands.LOAD: Command(name=Commands.LOAD, validators_fns=[ArgValidators.get_min_max_fn(min_value=2, max_value=2)], description="Execute commands from file for testing", usage="load <path>"),
+        Commands.TRACE: Command(name=Commands.TRACE, validators_fns=[ArgValidators.get_min_max_fn(min_value=2, max_value=3)], description="Records every command with its time, drive and pwd to a JSON lines file on disk.", usage="trace start <disk_path> or trace stop"),
+        Commands.REPLAY: Command(name=Commands.REPLAY, validators_fns=[ArgValidators.get_min_max_fn(min_value=2, max_value=4)], description="Replays a trace against fresh drives and reports throughput and latency percentiles per command. Modes: max (default) or paced.", usage="replay <disk_path> or replay <disk_path> paced or replay <disk_path> max 8"),
+        Commands.BEGIN: Command(name=Commands.BEGIN, validators_fns=[ArgValidators.get_min_max_fn(min_value=1, max_value=1)], description="Starts a transaction on the current drive.", usage="begin <enter>"),
+        Commands.COMMIT: Command(name=Commands.COMMIT, validators_fns=[ArgValidators.get_min_max_fn(min_value=1, max_value=1)], description="Commits the open transaction.", usage="commit <enter>"),
+        Commands.ABORT: Command(name=Commands.ABORT, validators_fns=[ArgValidators.get_min_max_fn(min_value=1, max_value=1)], description="Rolls back all changes made by the open transaction.", usage="abort <enter>"),
+        Commands.CHANGES_SINCE: Command(name=Commands.CHANGES_SINCE, validators_fns=[ArgValidators.get_min_max_fn(min_value=2, max_value=2)], description="Lists files created, written or deleted after a generation of the current drive.", usage="changes-since 0 or changes-since <generation>"),
+        Commands.IMPORT: Command(name=Commands.IMPORT, validators_fns=[ArgValidators.get_min_max_fn(min_value=2, max_value=2)], description="Applies a file written by export to the current drive, e.g. a full export followed by incremental ones.", usage="import <disk_path>"),
+        Commands.EXPORT: Command(name=Commands.EXPORT, validators_fns=[ArgValidators.get_min_max_fn(min_value=3, max_value=3)], description="Exports the changes after a generation to a JSON lines file on disk. Generation 0 exports the whole drive.", usage="export <generation> <disk_path>"),
         Commands.NEW: Command(name=Commands.NEW, validators_fns=[ArgValidators.get_min_max_fn(min_value=2, max_value=2)], description="Creates a new virtual drive", usage="new test_drive"),
         Commands.MOUNT: Command(name=Commands.MOUNT, validators_fns=[ArgValidators.get_min_max_fn(min_value=2, max_value=2)], description="Mounts an existing virtual drive.", usage="mount test_drive"),
         Commands.DRIVES: Command(name=Commands.DRIVES, validators_fns=[ArgValidators.get_min_max_fn(min_value=1, max_value=1)], description="Lists all virtual drives.", usage="drives <enter>"),
+        Commands.UNMOUNT: Command(name=Commands.UNMOUNT, validators_fns=[ArgValidators.get_min_max_fn(min_value=2, max_value=3)], description="Persists a virtual drive to disk and releases its memory.", usage="unmount test_drive or unmount test_drive <image_path>"),
+        Commands.DROP: Command(name=Commands.DROP, validators_fns=[ArgValidators.get_min_max_fn(min_value=2, max_value=2)], description="Removes a virtual drive.", usage="drop test_drive"),
+        Commands.ATTACH: Command(name=Commands.ATTACH, validators_fns=[ArgValidators.get_min_max_fn(min_value=3, max_value=3)], description="Registers a drive image. It is loaded on first mount.", usage="attach test_drive <image_path>"),
         Commands.ECHO: Command(name=Commands.ECHO, validators_fns=[ArgValidators.get_min_max_fn(min_value=2, max_value=None)], description=Commands.ECHO, usage="echo some text"),
     }
 
@@ -102,9 +123,8 @@ class DebugLogger:
     # Defaults to console. Can be changed to a file.
     log_out = sys.stdout
 
-    # Disables the logger at runtime. Set it to False in prod.
-    # TODO(maryamq): Fix logging at registration (ext and virtual drives - the code that runs at module load.)
-    enabled = True
+    # Enables the logger at runtime. Off by default, so library users (e.g. mem_os) get no output.
+    enabled = False
 
     @classmethod
     def get_logger_fn(cls, src_prefix: str):
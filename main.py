@@ -4,20 +4,65 @@ from environment import Environment
 from logging_utils import CommandValidator
 from file_return_codes import FileReturnCodes
 import os
+import path_utils
+import sys
 from constants import Commands
 
+# tail -f stops after this many seconds without a write, so it cannot block a script or the prompt forever.
+_FOLLOW_IDLE_SECS = 10.0
+
 
 def has_cmd_arg(command_line_arr: list[str]) -> bool:
     return len(command_line_arr) > 1 and command_line_arr[1]
 
 
-def execute_commands_from_file(env, file_name):
+def resolve_drive_path(env, path: str):
+    """ Resolves a path that can name a drive, e.g. test:/movies. Plain paths use the current drive and pwd.
+    Returns: (drive, working dir, path within the drive, return code)
+    """
+    drive_name, drive_path = path_utils.split_drive(path)
+    if drive_name is None:
+        return env.current_drive, env.present_working_dir, path, FileReturnCodes.SUCCESS
+    drive, ret = env.mount_drive(drive_name)
+    if ret != FileReturnCodes.SUCCESS:
+        return None, None, drive_path, ret
+    return drive, drive.root, drive_path, ret
+
+
+def parse_line_range_args(comps: list[str]):
+    """ Parses head/tail arguments: [-f] [-t <idle_secs>] [-n <num_lines>] <path>.
+    Returns: (path, num_lines, follow, idle_secs). path is None if the arguments are invalid.
+    """
+    num_lines, follow, idle_secs, path = 10, False, _FOLLOW_IDLE_SECS, None
+    args = iter(comps[1:])
+    for arg in args:
+        if arg == "-f":
+            follow = True
+        elif arg in ["-n", "-t"]:
+            try:
+                value = int(next(args, "")) if arg == "-n" else float(next(args, ""))
+            except ValueError:
+                return None, num_lines, follow, idle_secs
+            if value < 0:
+                return None, num_lines, follow, idle_secs
+            if arg == "-n":
+                num_lines = value
+            else:
+                idle_secs = value
+        else:
+            path = arg
+    return path, num_lines, follow, idle_secs
+
+
+def execute_commands_from_file(env, file_name, errors=None):
     """ Reads and executes commands from a file. Useful for testing and iteration during dev.
+    If errors is a list, invalid lines, failed commands and exceptions are appended to it as messages
+    and the remaining lines still run.
     """
     all_commands = ""
     with open(file_name) as f:
         all_commands = f.readlines()
-    for line in all_commands:
+    for line_num, line in enumerate(all_commands, start=1):
         line = line.strip()
         if not line:
             continue
@@ -27,9 +72,21 @@ def execute_commands_from_file(env, file_name):
         valid_cmd_syntax, msg = CommandValidator.validate(comps)
         if not valid_cmd_syntax:
             print(f"Error executing line: {line}.")
-        else:
-            print(">>", line)
+            if errors is not None:
+                errors.append(f"line {line_num}: {line}: Invalid Command: {msg}")
+            continue
+        print(">>", line)
+        if errors is None:
             process_command(env, comps)
+            continue
+        try:
+            ret = process_command(env, comps)
+        except Exception as e:
+            errors.append(f"line {line_num}: {line}: {e!r}")
+            continue
+        if ret != FileReturnCodes.SUCCESS:
+            name = comps[1] if len(comps) > 1 else ""
+            errors.append(f"line {line_num}: {line}: {FileReturnCodes.message(ret, name=name)}")
     print(
         f"Executed {len(all_commands)} commands. Type sys <enter> to view the structure. Starting user IO\n\n")
 
@@ -51,125 +108,512 @@ def execute_commands_from_io(env):
                 print(f"Invalid Command: {msg}")
                 continue
             process_command(env, comps)
+        except EOFError:  # End of piped input.
+            print("GoodBye!")
+            return
         except Exception as e:  # catching all exception here to avoid destroying state.
             print(e)
 
 
-def process_command(env, comps):
+# Command name -> handler. Handlers take (env, comps) and return a FileReturnCodes value.
+_command_handlers = {}
+
+
+def command_handler(*commands):
+    """ Registers a function as the handler of one or more commands."""
+    def reg_fn(handler_fn):
+        for command in commands:
+            _command_handlers[command] = handler_fn
+        return handler_fn
+    return reg_fn
+
+
+def process_command(env, comps) -> int:
+    if env.trace_recorder:
+        env.trace_recorder.record(env, comps)
+    handler_fn = _command_handlers.get(comps[0])
+    if handler_fn is None:
+        print("Unknown Command!")
+        return FileReturnCodes.UNSUPPORTED
+    return handler_fn(env, comps)
+
+
+@command_handler(Commands.LS)
+def handle_ls(env, comps) -> int:
+    if not has_cmd_arg(comps):
+        print(env.present_working_dir)
+        return FileReturnCodes.SUCCESS
+    dir_obj, ret = env.current_drive.get_dir(
+        env.present_working_dir, comps[1])
+    FileReturnCodes.print_message(
+        ret, message="Listing files in: ", name=comps[1])
+    if ret == FileReturnCodes.SUCCESS:
+        print(dir_obj)
+    return ret
+
+
+@command_handler(Commands.PWD)
+def handle_pwd(env, comps) -> int:
+    print(env.present_working_dir.absolute_path)
+    return FileReturnCodes.SUCCESS
+
+
+@command_handler(Commands.CD)
+def handle_cd(env, comps) -> int:
+    valid_dir, ret = env.current_drive.get_dir(
+        env.present_working_dir, comps[1])
+    if ret == FileReturnCodes.SUCCESS:
+        env.present_working_dir = valid_dir
+    FileReturnCodes.print_message(ret, name=comps[1])
+    return ret
+
+
+@command_handler(Commands.MK, Commands.MKDIR)
+def handle_mk(env, comps) -> int:
+    # The file type is picked by the extension.
+    ret = env.current_drive.make_file(
+        env.present_working_dir, comps[1], FileType.DIR)
+    FileReturnCodes.print_message(
+        ret, name=comps[1], success_msg="Created ", err_msg="Problem creating file. ")
+    return ret
+
+
+@command_handler(Commands.RM)
+def handle_rm(env, comps) -> int:
+    ret = env.current_drive.remove_file(
+        env.present_working_dir, comps[1])
+    if ret == FileReturnCodes.UNSUPPORTED:
+        print("Cannot delete root dir.")
+    else:
+        FileReturnCodes.print_message(
+            ret, name=comps[1], success_msg="Deleted ")
+    return ret
+
+
+@command_handler(Commands.MVFILE, Commands.CP)
+def handle_move_copy(env, comps) -> int:
     command = comps[0]
-    # TODO(maryamq): use match..case to simplify.
-    if command == Commands.LS:
-        if has_cmd_arg(comps):
-            dir_path = comps[1]
-            dir_obj, ret = env.current_drive.get_dir(
-                env.present_working_dir, dir_path)
-            FileReturnCodes.print_message(
-                ret, message="Listing files in: ", name=comps[1])
-            if ret == FileReturnCodes.SUCCESS:
-                print(dir_obj)
+    src_drive, src_dir, src_path, ret = resolve_drive_path(env, comps[1])
+    if ret != FileReturnCodes.SUCCESS:
+        FileReturnCodes.print_message(ret, name=comps[1])
+        return ret
+    with env.pinned(src_drive):  # Mounting the destination must not evict it.
+        dest_drive, dest_dir, dest_path, ret = resolve_drive_path(env, comps[2])
+        if ret != FileReturnCodes.SUCCESS:
+            FileReturnCodes.print_message(ret, name=comps[2])
+            return ret
+        if command == Commands.MVFILE:
+            ret = src_drive.move_to(src_dir, src_path, dest_drive, dest_dir, dest_path)
         else:
-            print(env.present_working_dir)
-    elif command == Commands.PWD:
-        print(env.present_working_dir.absolute_path)
-    elif command == Commands.CD:
-        valid_dir, ret = env.current_drive.get_dir(
-            env.present_working_dir, comps[1])
-        if ret == FileReturnCodes.SUCCESS:
-            env.present_working_dir = valid_dir
+            ret = src_drive.copy_to(src_dir, src_path, dest_drive, dest_dir, dest_path)
+    if env.present_working_dir.drive is not env.current_drive:
+        env.present_working_dir = env.current_drive.root  # pwd was moved to another drive.
+    FileReturnCodes.print_message(
+        ret, name=comps[1], success_msg="Moved " if command == Commands.MVFILE else "Copied ")
+    return ret
+
+
+@command_handler(Commands.WRITE)
+def handle_write(env, comps) -> int:
+    path = comps[1]
+    mode = "overwrite"
+    content_idx = 2
+    if len(comps) > 3 and comps[2] in ["-a"]:
+        mode = "append"
+        content_idx += 1
+    content = " ".join(comps[content_idx:])
+    ret = env.current_drive.write_file(
+        env.present_working_dir, path, content, write_mode=mode)
+    FileReturnCodes.print_message(ret, name=comps[1])
+    return ret
+
+
+@command_handler(Commands.CAT)
+def handle_cat(env, comps) -> int:
+    file, ret = env.current_drive.get_file(
+        env.present_working_dir, comps[1])
+    if ret == FileReturnCodes.SUCCESS and file.type == FileType.DIR:
+        ret = FileReturnCodes.INVALID_PATH
+    FileReturnCodes.print_message(
+        ret, name=comps[1], success_msg="Content For ")
+    if ret == FileReturnCodes.SUCCESS:
+        print(file)
+    return ret
+
+
+@command_handler(Commands.HEAD, Commands.TAIL)
+def handle_head_tail(env, comps) -> int:
+    path, num_lines, follow, idle_secs = parse_line_range_args(comps)
+    if not path:
+        print(CommandValidator.help(comps[0]))
+        return FileReturnCodes.INVALID_PATH
+    file, ret = env.current_drive.get_file(
+        env.present_working_dir, path, type=FileType.TEXT_FILE)
+    if ret != FileReturnCodes.SUCCESS:
+        FileReturnCodes.print_message(ret, name=path)
+    elif follow and comps[0] == Commands.TAIL:
+        try:
+            for line in env.current_drive.follow(env.present_working_dir, path, num_lines, idle_secs):
+                print(line, end="")
+        except KeyboardInterrupt:
+            print()
+    else:
+        text = file.head(num_lines) if comps[0] == Commands.HEAD else file.tail(num_lines)
+        print(text, end="" if text.endswith("\n") else "\n")
+    return ret
+
+
+@command_handler(Commands.LINES)
+def handle_lines(env, comps) -> int:
+    file, ret = env.current_drive.get_file(
+        env.present_working_dir, comps[1], type=FileType.TEXT_FILE)
+    if ret != FileReturnCodes.SUCCESS:
         FileReturnCodes.print_message(ret, name=comps[1])
-    elif command == Commands.MK:
-        ret = env.current_drive.make_file(
-            env.present_working_dir, comps[1], FileType.DIR)
-        FileReturnCodes.print_message(
-            ret, name=comps[1], success_msg="Created ", err_msg="Problem creating file. ")
-    elif command == Commands.RM:
-        dir_obj, ret = env.current_drive.get_file(
-            env.present_working_dir, comps[1])
-        if dir_obj and dir_obj == env.current_drive.root:
-            print("Cannot delete root dir.")
+        return ret
+    if not (comps[2].isdigit() and comps[3].isdigit()):
+        print(CommandValidator.help(comps[0]))
+        return FileReturnCodes.INVALID_PATH
+    text = file.read_lines(max(0, int(comps[2]) - 1), int(comps[3]))
+    print(text, end="" if text.endswith("\n") else "\n")
+    return ret
+
+
+@command_handler(Commands.FIND)
+def handle_find(env, comps) -> int:
+    search_term = " ".join(comps[2:])
+    search_results, ret = env.current_drive.search(
+        env.present_working_dir, comps[1], search_term)
+    if ret == FileReturnCodes.SUCCESS:
+        print(f"Found {len(search_results)} entries")
+        print(search_results)
+    else:
+        FileReturnCodes.print_message(ret, name=comps[1])
+    return ret
+
+
+@command_handler(Commands.INDEX)
+def handle_index(env, comps) -> int:
+    drive = env.current_drive
+    if comps[1] == "on":
+        drive.enable_text_index()
+        print(f"Full-text index enabled on {drive.name}")
+    elif comps[1] == "off":
+        drive.disable_text_index()
+        print(f"Full-text index disabled on {drive.name}")
+    elif comps[1] == "stats" and drive.text_index is not None:
+        for key, value in drive.text_index.stats().items():
+            print(f"{key}: {value:,.2f}" if isinstance(value, float) else f"{key}: {value:,}")
+    else:
+        print(CommandValidator.help(Commands.INDEX))
+        return FileReturnCodes.UNSUPPORTED
+    return FileReturnCodes.SUCCESS
+
+
+@command_handler(Commands.SEARCH_TEXT)
+def handle_search_text(env, comps) -> int:
+    import shlex  # Only needed for quoted phrases.
+    try:
+        terms = shlex.split(" ".join(comps[1:]))
+    except ValueError as e:  # e.g. an unbalanced quote.
+        print(f"Error! {e}. {CommandValidator.help(Commands.SEARCH_TEXT)}")
+        return FileReturnCodes.UNSUPPORTED
+    mode = "or" if "OR" in terms else "and"
+    terms = [term for term in terms if term != "OR"]
+    search_results, ret = env.current_drive.search_text(terms, mode)
+    if ret == FileReturnCodes.SUCCESS:
+        print(f"Found {len(search_results)} entries")
+        print(search_results)
+    else:
+        print("Error! The full-text index is disabled. Type index on to enable it.")
+    return ret
+
+
+@command_handler(Commands.BEGIN)
+def handle_begin(env, comps) -> int:
+    ret = env.current_drive.begin()
+    if ret != FileReturnCodes.SUCCESS:
+        print("Error! A transaction is already open.")
+        return ret
+    print(f"Started a transaction on {env.current_drive.name}")
+    return ret
+
+
+@command_handler(Commands.COMMIT, Commands.ABORT)
+def handle_commit_abort(env, comps) -> int:
+    drive = env.current_drive
+    ret = drive.commit() if comps[0] == Commands.COMMIT else drive.abort()
+    if ret != FileReturnCodes.SUCCESS:
+        print(f"Error! No open transaction on {drive.name}")
+        return ret
+    print(f"{comps[0]}: done on {drive.name}")
+    pwd_dir, _ = drive.get_dir(
+        drive.root, env.present_working_dir.absolute_path)
+    if pwd_dir is not env.present_working_dir:
+        env.present_working_dir = drive.root  # pwd was rolled back.
+    return ret
+
+
+@command_handler(Commands.CHANGES_SINCE, Commands.EXPORT)
+def handle_changes(env, comps) -> int:
+    if not comps[1].isdigit():
+        print(CommandValidator.help(comps[0]))
+        return FileReturnCodes.INVALID_PATH
+    drive = env.current_drive
+    if comps[0] == Commands.CHANGES_SINCE:
+        changes = drive.changes_since(int(comps[1]))
+        print(f"Found {len(changes)} changes. Current generation: {drive.generation}")
+        for change in changes:
+            print(f"{change.generation}\t{change.kind}\t{change.path}")
+    else:
+        with open(comps[2], "w") as out:
+            generation, num_records = drive.export_since(int(comps[1]), out)
+        print(f"Exported {num_records} records to {comps[2]}. Next export: export {generation} <disk_path>")
+    return FileReturnCodes.SUCCESS
+
+
+@command_handler(Commands.IMPORT)
+def handle_import(env, comps) -> int:
+    if not os.path.exists(comps[1]):
+        FileReturnCodes.print_message(FileReturnCodes.INVALID_PATH, name=comps[1])
+        return FileReturnCodes.INVALID_PATH
+    from file_return_codes import MemFSError
+    try:
+        with open(comps[1]) as f:
+            num_records = env.current_drive.import_changes(f)
+    except MemFSError as e:
+        print(f"Error! Nothing was imported. {e.strerror}: {e.filename}")
+        return e.return_code or FileReturnCodes.UNSUPPORTED
+    except (ValueError, KeyError) as e:
+        print(f"Error! Nothing was imported. {comps[1]} is not an export: {e!r}")
+        return FileReturnCodes.UNSUPPORTED
+    print(f"Imported {num_records} records from {comps[1]}. Current generation: {env.current_drive.generation}")
+    return FileReturnCodes.SUCCESS
+
+
+# ****************Commands for Managing a new FS.************n
+@command_handler(Commands.NEW)
+def handle_new(env, comps) -> int:
+    if not has_cmd_arg(comps):
+        print("Missing drive name. Usage: new <drive_name>")
+        return FileReturnCodes.INVALID_PATH
+    if virtual_mem_drive_registry.is_registered(comps[1]):
+        print(
+            f"Error: {comps[1]} already exists. Please specify a new name.")
+        return FileReturnCodes.ALREADY_EXIST
+    fs = MemFileSystem(comps[1])
+    print(f"Creating a new in-memory drive: {fs.name}")
+    return FileReturnCodes.SUCCESS
+
+
+@command_handler(Commands.DRIVES)
+def handle_drives(env, comps) -> int:
+    print("List of all drives")
+    for k in virtual_mem_drive_registry.drive_names():
+        if virtual_mem_drive_registry.is_resident(k):
+            print(k)
         else:
-            if ret == FileReturnCodes.SUCCESS:
-                ret = dir_obj.delete()
-            FileReturnCodes.print_message(
-                ret, name=comps[1], success_msg="Deleted ")
-    elif command == Commands.MK:
-        ret = env.current_drive.make_file(
-            env.present_working_dir, comps[1], FileType.TEXT_FILE)
+            print(f"{k} (stored)")
+    return FileReturnCodes.SUCCESS
+
+
+@command_handler(Commands.MOUNT)
+def handle_mount(env, comps) -> int:
+    current_drive, ret = virtual_mem_drive_registry.mount(comps[1])
+    if ret != FileReturnCodes.SUCCESS:
+        print("Error! Please specify an existing drive name.")
+        return ret
+    env.current_drive = current_drive
+    print("Switched Drives: ", env.current_drive.name)
+    return ret
+
+
+@command_handler(Commands.UNMOUNT)
+def handle_unmount(env, comps) -> int:
+    image_path = comps[2] if len(comps) > 2 else None
+    ret = virtual_mem_drive_registry.unmount(comps[1], image_path)
+    if ret == FileReturnCodes.UNSUPPORTED:
+        print("Error! Cannot unmount a drive that is in use. Mount another drive first.")
+        return ret
+    FileReturnCodes.print_message(
+        ret, name=comps[1], success_msg="Unmounted ")
+    return ret
+
+
+@command_handler(Commands.DROP)
+def handle_drop(env, comps) -> int:
+    ret = virtual_mem_drive_registry.drop(comps[1])
+    if ret == FileReturnCodes.UNSUPPORTED:
+        print("Error! Cannot drop a drive that is in use. Mount another drive first.")
+        return ret
+    FileReturnCodes.print_message(
+        ret, name=comps[1], success_msg="Dropped ")
+    return ret
+
+
+@command_handler(Commands.ATTACH)
+def handle_attach(env, comps) -> int:
+    if not os.path.exists(comps[2]):
         FileReturnCodes.print_message(
-            ret, name=comps[1], success_msg="Created ")
-    elif command == Commands.MVFILE:
-        selected_file, future_dir = comps[1], comps[2]
-        ret = env.current_drive.move_file(
-            env.present_working_dir, selected_file, future_dir)
-        FileReturnCodes.print_message(ret, name=comps[1], success_msg="Moved ")
-    elif command == Commands.WRITE:
-        path = comps[1]
-        mode = "overwrite"
-        content_idx = 2
-        if len(comps) > 3 and comps[2] in ["-a"]:
-            mode = "append"
-            content_idx += 1
-        content = " ".join(comps[content_idx:])
-        file, ret = env.current_drive.get_file(
-            env.present_working_dir, path, type=FileType.TEXT_FILE)
-        if ret == FileReturnCodes.SUCCESS:
-            file.add_content(content, write_mode=mode)
-        FileReturnCodes.print_message(ret, name=comps[1])
-    elif command == Commands.CAT:
-        file, ret = env.current_drive.get_file(
-            env.present_working_dir, comps[1], type=FileType.TEXT_FILE)
+            FileReturnCodes.INVALID_PATH, name=comps[2])
+        return FileReturnCodes.INVALID_PATH
+    ret = virtual_mem_drive_registry.register_lazy(comps[1], comps[2])
+    FileReturnCodes.print_message(
+        ret, name=comps[1], success_msg="Attached ")
+    return ret
+
+
+@command_handler(Commands.LOAD)
+def handle_load(env, comps) -> int:
+    print("Loading file: ", comps[1])
+    execute_commands_from_file(env, comps[1])
+    return FileReturnCodes.SUCCESS
+
+
+@command_handler(Commands.LOAD_ALL)
+def handle_load_all(env, comps) -> int:
+    import script_loader  # Starts worker processes. Only imported when needed.
+    if len(comps) > 2 and not comps[2].isdigit():
+        print(CommandValidator.help(Commands.LOAD_ALL))
+        return FileReturnCodes.UNSUPPORTED
+    if not os.path.exists(comps[1]):
         FileReturnCodes.print_message(
-            ret, name=comps[1], success_msg="Content For ")
-        if ret == FileReturnCodes.SUCCESS:
-            print(file)
-    elif command == Commands.FIND:
-        file_to_search = comps[1]
-        search_term = " ".join(comps[2:])
-        search_results, ret = env.current_drive.search(
-            env.present_working_dir, file_to_search, search_term)
-        if ret == FileReturnCodes.SUCCESS:
-            print(f"Found {len(search_results)} entries")
-            print(search_results)
-        else:
-            FileReturnCodes.print_message(ret, name=comps[1])
-    # ****************Commands for Managing a new FS.************n
-    elif command == Commands.NEW:
-        if not has_cmd_arg(comps):
-            print("Missing drive name. Usage: new <drive_name>")
-            return
-        new_drive_name = comps[1]
-        if comps[1] in virtual_mem_drive_registry.registry:
-            print(
-                f"Error: {comps[1]} already exists. Please specify a new name.")
-            return
-        fs = MemFileSystem(comps[1])
-        print(f"Creating a new in-memory drive: {fs.name}")
-    elif command == Commands.DRIVES:
-        print("List of all drives")
-        for k in virtual_mem_drive_registry.registry.keys():
-            print(k)
-    elif command == Commands.MOUNT:
-        if not has_cmd_arg(comps) or comps[1] not in virtual_mem_drive_registry.registry:
-            print("Error! Please specify an existing drive name.")
-            return
-        current_drive = virtual_mem_drive_registry.registry[comps[1]]
-        env.current_drive = current_drive
-        print("Switched Drives: ", env.current_drive.name)
-    elif command == Commands.LOAD:
-        print("Loading file: ", comps[1])
-        execute_commands_from_file(env, comps[1])
-    elif command == Commands.ECHO:
-        print(" ".join(comps[1:]))
-    elif command == Commands.SYS:
-        print(env.current_drive)
-    elif command == Commands.HELP:
-        cmd_name = comps[1] if len(comps) > 1 else None
-        print(CommandValidator.help(cmd_name))
+            FileReturnCodes.INVALID_PATH, name=comps[1])
+        return FileReturnCodes.INVALID_PATH
+    num_workers = int(comps[2]) if len(comps) > 2 else None
+    report, ret = script_loader.load_all(comps[1], num_workers)
+    if ret != FileReturnCodes.SUCCESS:
+        print("Error! The manifest lists scripts that do not exist.")
+        return ret
+    print(report)
+    if env.current_drive.name in {result.drive for result in report.results}:
+        env.current_drive, _ = virtual_mem_drive_registry.mount(env.current_drive.name)  # Replaced by the load.
+    return FileReturnCodes.SUCCESS if not report.num_errors else FileReturnCodes.UNSUPPORTED
+
+
+@command_handler(Commands.TRACE)
+def handle_trace(env, comps) -> int:
+    import command_trace  # Only needed while tracing.
+    if comps[1] == "start" and len(comps) == 3:
+        if env.trace_recorder:
+            env.trace_recorder.close()
+        env.trace_recorder = command_trace.TraceRecorder(comps[2])
+        print(f"Recording commands to {comps[2]}")
+    elif comps[1] == "stop" and env.trace_recorder:
+        env.trace_recorder.close()
+        print(f"Recorded {env.trace_recorder.num_records} commands to {env.trace_recorder.path}")
+        env.trace_recorder = None
     else:
-        print("Unknown Command!")
+        print(CommandValidator.help(Commands.TRACE))
+        return FileReturnCodes.UNSUPPORTED
+    return FileReturnCodes.SUCCESS
+
+
+@command_handler(Commands.WATCH)
+def handle_watch(env, comps) -> int:
+    if comps[1] == "start":
+        path = comps[2] if len(comps) > 2 else "."
+        file, ret = env.current_drive.get_file(env.present_working_dir, path)
+        if ret != FileReturnCodes.SUCCESS:
+            FileReturnCodes.print_message(ret, name=path)
+            return ret
+        if env.watch_subscription:
+            env.watch_subscription.close()
+        env.watch_subscription = env.current_drive.watch(file.absolute_path)
+        print(f"Watching {env.current_drive.name}:{env.watch_subscription.prefix}")
+    elif comps[1] in ["events", "stop"] and len(comps) == 2 and env.watch_subscription:
+        subscription = env.watch_subscription
+        for event in iter(subscription.get_nowait, None):
+            dest = f" -> {event.dest_path}" if event.dest_path else ""
+            count = f" ({event.count} writes)" if event.count > 1 else ""
+            print(f"{event.kind:<8}{event.drive}:{event.path}{dest}{count}")
+        if subscription.dropped:
+            print(f"Dropped {subscription.dropped} event(s). Rescan {subscription.prefix}.")
+        if comps[1] == "stop":
+            subscription.close()
+            env.watch_subscription = None
+    else:
+        print(CommandValidator.help(Commands.WATCH))
+        return FileReturnCodes.UNSUPPORTED
+    return FileReturnCodes.SUCCESS
+
+
+@command_handler(Commands.REPLAY)
+def handle_replay(env, comps) -> int:
+    import command_trace
+    mode = comps[2] if len(comps) > 2 else command_trace.MAX_SPEED
+    num_sessions = comps[3] if len(comps) > 3 else "1"
+    if mode not in [command_trace.MAX_SPEED, command_trace.PACED] or not num_sessions.isdigit() \
+            or int(num_sessions) < 1:
+        print(CommandValidator.help(Commands.REPLAY))
+        return FileReturnCodes.UNSUPPORTED
+    if not os.path.exists(comps[1]):
+        FileReturnCodes.print_message(
+            FileReturnCodes.INVALID_PATH, name=comps[1])
+        return FileReturnCodes.INVALID_PATH
+    records = command_trace.read_trace(comps[1])
+    print(command_trace.replay(records, process_command, mode, int(num_sessions)))
+    return FileReturnCodes.SUCCESS
+
+
+@command_handler(Commands.ECHO)
+def handle_echo(env, comps) -> int:
+    print(" ".join(comps[1:]))
+    return FileReturnCodes.SUCCESS
+
+
+@command_handler(Commands.SYS)
+def handle_sys(env, comps) -> int:
+    print(env.current_drive)
+    return FileReturnCodes.SUCCESS
+
+
+@command_handler(Commands.MEM)
+def handle_mem(env, comps) -> int:
+    top_n = comps[2] if len(comps) > 2 else "10"
+    if not top_n.isdigit():
+        print(CommandValidator.help(Commands.MEM))
+        return FileReturnCodes.INVALID_PATH
+    usage, ret = env.current_drive.memory_usage(
+        env.present_working_dir, comps[1], int(top_n))
+    if ret != FileReturnCodes.SUCCESS:
+        FileReturnCodes.print_message(ret, name=comps[1])
+        return ret
+    print(usage)
+    return ret
+
+
+@command_handler(Commands.MEM_TRACE)
+def handle_mem_trace(env, comps) -> int:
+    import mem_stats
+    top_n = comps[2] if len(comps) > 2 else "10"
+    if comps[1] == "start" and len(comps) == 2 and not env.allocation_profiler:
+        env.allocation_profiler = mem_stats.AllocationProfiler()
+        env.allocation_profiler.start()
+        print("Tracing allocations. Type mem-trace stop for a report.")
+    elif comps[1] == "stop" and top_n.isdigit() and env.allocation_profiler:
+        operations = env.allocation_profiler.stop(int(top_n))
+        env.allocation_profiler = None
+        print(f"{'operation':<20}{'live bytes':>14}{'blocks':>10}")
+        for operation, num_bytes, num_blocks in operations:
+            print(f"{operation:<20}{num_bytes:>14,}{num_blocks:>10,}")
+    else:
+        print(CommandValidator.help(Commands.MEM_TRACE))
+        return FileReturnCodes.UNSUPPORTED
+    return FileReturnCodes.SUCCESS
+
+
+@command_handler(Commands.HELP)
+def handle_help(env, comps) -> int:
+    cmd_name = comps[1] if len(comps) > 1 else None
+    print(CommandValidator.help(cmd_name))
+    return FileReturnCodes.SUCCESS
 
 
 if __name__ == "__main__":
+    # python main.py [script]: with a script, runs its commands and exits.
     env = Environment.get_default(enable_debug_logging=False)
-    print("Welcome to InMemFS. Type help to get started. Type 'exit' to exit.")
-    execute_commands_from_io(env)
+    if len(sys.argv) > 1:
+        execute_commands_from_file(env, sys.argv[1])
+    else:
+        print("Welcome to InMemFS. Type help to get started. Type 'exit' to exit.")
+        execute_commands_from_io(env)
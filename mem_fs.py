@@ -1,12 +1,17 @@
 from io import StringIO
+from contextlib import contextmanager
+import threading
 from base_file import BaseFile, FileType
 from virtual_mem_drive_registry import VirtualMemDriveRegistry
 from directory import Directory
-from content_files import TextFile
 from logging_utils import DebugLogger
 from file_return_codes import FileReturnCodes
+import generations
+import mem_stats
 import path_utils
-from file_extension_registry import file_creator_factory
+import text_index
+import watch
+from file_extension_registry import file_creator_factory, get_extension
 
 
 class MemFileSystem(metaclass=VirtualMemDriveRegistry):
@@ -15,8 +20,44 @@ class MemFileSystem(metaclass=VirtualMemDriveRegistry):
     def __init__(self, name):
         self._name = name
         self._root = Directory(MemFileSystem.ROOT_DIR)
+        self._root.owner_drive = self
         self._children = {}
         self._logger = DebugLogger.get_logger_fn("MemFileSystem_" + name)
+        # Serializes mutations. Held for the lifetime of a transaction.
+        self._lock = threading.RLock()
+        # Undo functions of the open transaction. None when no transaction is open.
+        self._undo_log = None
+        self._txn_thread = None
+        # Number of applied mutations.
+        self._mutation_count = 0
+        # Mutations applied since the last flush, and the nesting depth of _mutation() blocks.
+        self._num_applied = 0
+        self._mutation_depth = 0
+        # Last generation handed out. See the generations module.
+        self._generation = 0
+        self._watch_hub = watch.WatchHub()
+        self._text_index = None
+
+    def __getstate__(self):
+        """ Drives are persisted by the registry. Loggers, locks and open transactions are not picklable."""
+        state = self.__dict__.copy()
+        for key in ["_logger", "_lock", "_undo_log", "_txn_thread", "_watch_hub", "_num_applied",
+                    "_mutation_depth"]:
+            state.pop(key, None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.__dict__.setdefault("_generation", 0)  # Images saved before generations were tracked.
+        self._logger = DebugLogger.get_logger_fn("MemFileSystem_" + self._name)
+        self._lock = threading.RLock()
+        self._undo_log = None
+        self._txn_thread = None
+        self._num_applied = 0
+        self._mutation_depth = 0
+        self._watch_hub = watch.WatchHub()
+        if self._text_index is not None:
+            text_index.active_indexes += 1
 
     @property
     def root(self):
@@ -26,22 +67,414 @@ class MemFileSystem(metaclass=VirtualMemDriveRegistry):
     def name(self):
         return self._name
 
+    @name.setter
+    def name(self, new_name):
+        """ Renames an unregistered drive, e.g. a drive loaded from an image under a new name."""
+        self._name = new_name
+        self._logger = DebugLogger.get_logger_fn("MemFileSystem_" + new_name)
+
+    @property
+    def watch_hub(self):
+        return self._watch_hub
+
+    @watch_hub.setter
+    def watch_hub(self, hub: watch.WatchHub):
+        """ Reattaches the subscriptions of an earlier instance of this drive, e.g. after an unmount and mount."""
+        self._watch_hub = hub
+
+    def take_over(self, old_drive):
+        """ Takes the place of old_drive, e.g. when a loaded copy replaces a registered drive.
+        Watch subscriptions move to this drive. The text index of old_drive is dropped, so it stops counting
+        against every write. Files and directories of old_drive stay as they were: pwds of other environments,
+        open mem_os files and tail -f followers keep reading the old tree.
+        """
+        self._watch_hub = old_drive._watch_hub
+        old_drive.disable_text_index()
+
+    def watch(self, prefix="/", maxsize=1024) -> watch.Subscription:
+        """ Subscribes to create, write, move and delete events under prefix.
+        Close the subscription (or use it as a context manager) to stop receiving events.
+        """
+        return self._watch_hub.subscribe(prefix, maxsize)
+
+    @property
+    def text_index(self):
+        """ The inverted index over text files. None unless enable_text_index() was called."""
+        return self._text_index
+
+    def enable_text_index(self):
+        """ Builds the inverted index over all text files. It is kept up to date by every write."""
+        if self._text_index is None:
+            self._text_index = text_index.TextIndex()
+            self._text_index.add_subtree(self._root)
+            text_index.active_indexes += 1
+        return self._text_index
+
+    def disable_text_index(self):
+        if self._text_index is not None:
+            self._text_index = None
+            text_index.active_indexes -= 1
+
+    def search_text(self, terms: list[str], mode="and"):
+        """ Returns the paths of text files that contain all (mode=and) or any (mode=or) of the terms.
+        Terms with several words are phrases. Requires enable_text_index().
+        """
+        if self._text_index is None:
+            return [], FileReturnCodes.UNSUPPORTED
+        files = self._text_index.query(terms, mode)
+        return sorted(file.absolute_path for file in files), FileReturnCodes.SUCCESS
+
+    def memory_usage(self, working_dir: Directory, input_path: str, top_n=10):
+        """ Estimates the memory held under a path, by file type and component, with the top_n largest
+        files and directories. Returns: (mem_stats.MemUsage, return code)
+        """
+        with self._lock:
+            file, ret = self.get_file(working_dir, input_path)
+            if ret != FileReturnCodes.SUCCESS:
+                return None, ret
+            return mem_stats.memory_usage(file, top_n), ret
+
+    def follow(self, working_dir: Directory, input_path: str, num_lines=10, timeout=None):
+        """ Similar to tail -f. Yields the last num_lines lines of a text file, then every complete
+        line appended to it. Stops when the file is moved or deleted, or when no write arrives within
+        timeout seconds. If the file is overwritten with fewer lines, it is followed from the start.
+        """
+        file, ret = self.get_file(working_dir, input_path, type=FileType.TEXT_FILE)
+        if ret != FileReturnCodes.SUCCESS:
+            return
+        with self.watch(file.absolute_path) as events:
+            next_line = max(0, file.complete_line_count() - num_lines)
+            while True:
+                complete_lines = file.complete_line_count()
+                if complete_lines < next_line:  # Overwritten.
+                    next_line = 0
+                for line in range(next_line, complete_lines):
+                    yield file.read_lines(line, line + 1)
+                next_line = complete_lines
+                event = events.get(timeout)
+                if event is None or event.kind in [watch.DELETE, watch.MOVE]:
+                    return
+
+    @property
+    def mutation_count(self):
+        return self._mutation_count
+
+    @property
+    def generation(self) -> int:
+        """ The generation of the last change. Pass it to changes_since() to get later changes."""
+        return self._generation
+
+    def next_generation(self) -> int:
+        self._generation += 1
+        return self._generation
+
+    def changes_since(self, since: int) -> list[generations.Change]:
+        """ Returns the creates, writes and deletes after generation since, sorted by path.
+        Only changed subtrees are visited.
+        """
+        with self._lock:
+            return sorted(generations.changes_since(self._root, since), key=lambda change: change.path)
+
+    def export_since(self, since: int, out) -> tuple[int, int]:
+        """ Writes the changes after generation since to the text stream out as JSON lines. since=0 exports
+        the whole drive. Returns (generation, number of records). Use the generation as the next since.
+        """
+        with self._lock:
+            changes = generations.changes_since(self._root, since)
+            return self._generation, generations.export_changes(self._root, changes, out)
+
+    def import_changes(self, lines) -> int:
+        """ Applies the JSON lines of export_since in order. The import is atomic: it runs in a transaction
+        (or in the open transaction of the caller) and is rolled back if a record fails.
+        Returns the number of records.
+        """
+        if self._owns_transaction():
+            return generations.apply_changes(self, lines)
+        with self.transaction():
+            return generations.apply_changes(self, lines)
+
+    def compact_tombstones(self, before: int) -> int:
+        """ Forgets deletions up to generation before. Returns the number of dropped tombstones."""
+        with self._lock:
+            return generations.compact_tombstones(self._root, before)
+
+    @property
+    def in_transaction(self) -> bool:
+        return self._undo_log is not None
+
+    def begin(self) -> int:
+        """ Opens a transaction. Mutations are applied immediately and can be rolled back with abort().
+        The drive lock is held until commit() or abort(), so other threads wait for the transaction.
+        Change events are held and delivered in one batch at commit.
+        """
+        self._lock.acquire()
+        if self._undo_log is not None:  # Nested transactions are not supported.
+            self._lock.release()
+            return FileReturnCodes.UNSUPPORTED
+        self._undo_log = []
+        self._txn_thread = threading.get_ident()
+        self._watch_hub.hold()
+        return FileReturnCodes.SUCCESS
+
+    def commit(self) -> int:
+        """ Closes the open transaction and keeps all of its mutations."""
+        if not self._owns_transaction():
+            return FileReturnCodes.UNSUPPORTED
+        self._end_transaction()
+        return FileReturnCodes.SUCCESS
+
+    def abort(self) -> int:
+        """ Closes the open transaction and rolls back all of its mutations using the undo log."""
+        if not self._owns_transaction():
+            return FileReturnCodes.UNSUPPORTED
+        for undo_fn in reversed(self._undo_log):
+            undo_fn()
+        self._num_applied = 0
+        self._watch_hub.discard()  # Subscribers never saw the transaction.
+        self._end_transaction()
+        return FileReturnCodes.SUCCESS
+
+    @contextmanager
+    def transaction(self):
+        """ Runs a block of operations atomically. The transaction is aborted if the block raises."""
+        if self.begin() != FileReturnCodes.SUCCESS:
+            raise RuntimeError(f"{self._name}: A transaction is already open.")
+        try:
+            yield self
+        except BaseException:
+            self.abort()
+            raise
+        self.commit()
+
+    def _owns_transaction(self) -> bool:
+        return self._undo_log is not None and self._txn_thread == threading.get_ident()
+
+    def _end_transaction(self):
+        self._undo_log = None
+        self._txn_thread = None
+        self._flush()
+        self._lock.release()
+
+    @contextmanager
+    def _mutation(self):
+        """ Wraps an operation. Change events are held until the outermost operation ends and are then
+        flushed. Inside a transaction, the lock is already held and the flush is deferred to commit.
+        """
+        if self._owns_transaction():
+            yield
+            return
+        with self._lock:
+            if not self._mutation_depth:
+                self._watch_hub.hold()
+            self._mutation_depth += 1
+            try:
+                yield
+            finally:
+                self._mutation_depth -= 1
+                if not self._mutation_depth:
+                    self._flush()
+
+    def _flush(self):
+        """ Delivers held change events and updates instrumentation. Runs once per operation or once per
+        committed transaction. Operations that failed or changed nothing are not counted.
+        """
+        self._watch_hub.release()
+        if self._num_applied:
+            self._mutation_count += self._num_applied
+            if DebugLogger.enabled:
+                self._logger(f"Applied {self._num_applied} mutation(s). Total: {self._mutation_count}")
+            self._num_applied = 0
+
+    def _applied(self, undo_fn=None):
+        """ Records a successful mutation. Inside a transaction, undo_fn rolls it back on abort."""
+        self._num_applied += 1
+        if self._undo_log is not None:
+            self._undo_log.append(undo_fn)
+
     def move_file(self, working_dir: Directory, current_path: str, future_dir_path: str) -> int:
         """ Moves a file (text or dir) to a new directory.
         Files names at the new location must be unique.
         """
-        selected_file, ret_selected = self.get_file(working_dir, current_path)
-        if ret_selected != FileReturnCodes.SUCCESS:
-            return ret_selected
+        with self._mutation():
+            selected_file, ret_selected = self.get_file(working_dir, current_path)
+            if ret_selected != FileReturnCodes.SUCCESS:
+                return ret_selected
 
-        # Cannot move root.
-        if selected_file == self.root:
-            return FileReturnCodes.UNSUPPORTED
+            # Cannot move root.
+            if selected_file == self.root:
+                return FileReturnCodes.UNSUPPORTED
+
+            future_dir, ret_future_dir = self.get_dir(working_dir, future_dir_path)
+            if ret_future_dir != FileReturnCodes.SUCCESS:
+                return ret_future_dir
+            # A dir cannot be moved into its own subtree.
+            if MemFileSystem._is_ancestor(selected_file, future_dir):
+                return FileReturnCodes.INVALID_PATH
+            old_parent = selected_file.parent
+            old_path = selected_file.absolute_path
+            ret = selected_file.move(future_dir)
+            if ret == FileReturnCodes.SUCCESS:
+                self._publish_move(old_path, selected_file)
+                self._applied(lambda: self._undo_move(selected_file, old_parent))
+            return ret
+
+    def move_to(self, working_dir: Directory, current_path: str, dest_drive, dest_working_dir: Directory,
+                future_dir_path: str) -> int:
+        """ Moves a file or a subtree to a directory of another drive. The subtree is detached and attached
+        as a whole, with no per-node copies. Not supported while either drive has an open transaction.
+        """
+        if dest_drive is self:
+            return self.move_file(working_dir, current_path, future_dir_path)
+        with self._both_locked(dest_drive):
+            if self.in_transaction or dest_drive.in_transaction:
+                return FileReturnCodes.UNSUPPORTED
+            selected_file, ret = self.get_file(working_dir, current_path)
+            if ret != FileReturnCodes.SUCCESS:
+                return ret
+            if selected_file == self.root:
+                return FileReturnCodes.UNSUPPORTED
+            future_dir, ret = dest_drive.get_dir(dest_working_dir, future_dir_path)
+            if ret != FileReturnCodes.SUCCESS:
+                return ret
+            if selected_file.name in future_dir:
+                return FileReturnCodes.ALREADY_EXIST
+            # The source drive drops the subtree from its index and publishes a delete. The destination
+            # indexes it and publishes a create.
+            selected_file.parent.remove_child(selected_file.name, force_del=True)
+            # Generations of the subtree come from the source drive. The attach must be newer than all of them.
+            dest_drive._advance_generation(self._generation)
+            ret = future_dir.add_content(selected_file)
+            if ret == FileReturnCodes.SUCCESS:
+                self._applied()
+                dest_drive._applied()
+            return ret
+
+    def copy_to(self, working_dir: Directory, current_path: str, dest_drive, dest_working_dir: Directory,
+                future_dir_path: str) -> int:
+        """ Copies a file or a subtree to a directory of dest_drive, which can be this drive.
+        Line indexes are copied as they are, so text is not scanned again.
+        """
+        with self._both_locked(dest_drive):
+            selected_file, ret = self.get_file(working_dir, current_path)
+            if ret != FileReturnCodes.SUCCESS:
+                return ret
+            if selected_file == self.root:
+                return FileReturnCodes.UNSUPPORTED
+            future_dir, ret = dest_drive.get_dir(dest_working_dir, future_dir_path)
+            if ret != FileReturnCodes.SUCCESS:
+                return ret
+            if selected_file.name in future_dir:
+                return FileReturnCodes.ALREADY_EXIST
+            file_copy = selected_file.copy()
+            if file_copy is None:
+                return FileReturnCodes.UNSUPPORTED
+            ret = future_dir.add_content(file_copy)
+            if ret == FileReturnCodes.SUCCESS:
+                dest_drive._applied(lambda: future_dir.remove_child(file_copy.name, force_del=True))
+            return ret
+
+    @contextmanager
+    def _both_locked(self, other):
+        """ Locks two drives as one mutation of each. Locks are taken in a fixed order to avoid deadlocks."""
+        if other is self:
+            with self._mutation():
+                yield
+            return
+        first, second = (self, other) if id(self) < id(other) else (other, self)
+        with first._mutation(), second._mutation():
+            yield
+
+    def _advance_generation(self, generation: int):
+        self._generation = max(self._generation, generation)
+
+    def write_file(self, working_dir: Directory, input_path: str, content, write_mode="overwrite", end="\n") -> int:
+        """ Writes content to a text or binary file. write_mode is either overwrite or append."""
+        with self._mutation():
+            file, ret = self.get_file(working_dir, input_path)
+            if ret != FileReturnCodes.SUCCESS:
+                return ret
+            if file.type not in [FileType.TEXT_FILE, FileType.BINARY_FILE]:
+                return FileReturnCodes.INVALID_PATH
+            return self.write_to_file(file, content, write_mode, end)
+
+    def write_to_file(self, file: BaseFile, content, write_mode="overwrite", end="\n") -> int:
+        """ Same as write_file for an already resolved file."""
+        with self._mutation():
+            undo_fn = None
+            if self._undo_log is not None:
+                if write_mode == "append":
+                    prev_len = len(file)
+                    undo_fn = lambda: file.truncate(prev_len)
+                else:
+                    prev_content = file.getvalue()
+                    undo_fn = lambda: file.add_content(prev_content, write_mode="overwrite", end="")
+            file.add_content(content, write_mode=write_mode, end=end)
+            self._applied(undo_fn)
+            return FileReturnCodes.SUCCESS
+
+    def rename_file(self, working_dir: Directory, current_path: str, new_path: str) -> int:
+        """ Moves a file to new_path, which includes the new name. The extension cannot change.
+        """
+        with self._mutation():
+            selected_file, ret = self.get_file(working_dir, current_path)
+            if ret != FileReturnCodes.SUCCESS:
+                return ret
+            if selected_file == self.root:
+                return FileReturnCodes.UNSUPPORTED
+            new_dir, unmatched = self.get_valid_dir(working_dir, new_path)
+            if len(unmatched) > 1:
+                return FileReturnCodes.INVALID_PATH
+            if not unmatched or new_dir.has_child(unmatched[0]):
+                return FileReturnCodes.ALREADY_EXIST
+            new_name = unmatched[0]
+            if get_extension(new_name) != get_extension(selected_file.name):
+                return FileReturnCodes.UNSUPPORTED
+            if MemFileSystem._is_ancestor(selected_file, new_dir):
+                return FileReturnCodes.INVALID_PATH
+            old_dir, old_name = selected_file.parent, selected_file.name
+            self._relink(selected_file, new_dir, new_name)
+            self._applied(lambda: self._relink(selected_file, old_dir, old_name))
+            return FileReturnCodes.SUCCESS
+
+    def _relink(self, file: BaseFile, new_dir: Directory, new_name: str):
+        old_path = file.absolute_path
+        file.parent.remove_child(file.name, force_del=True, notify=False)
+        file.name = new_name
+        new_dir.add_content(file, notify=False)
+        self._publish_move(old_path, file)
+
+    def _undo_move(self, file: BaseFile, old_parent: Directory):
+        old_path = file.absolute_path
+        file.move(old_parent)
+        self._publish_move(old_path, file)
+
+    def _publish_move(self, old_path: str, file: BaseFile):
+        if watch.active_subscriptions:
+            self._watch_hub.publish(self._name, watch.MOVE, old_path, file.absolute_path)
+
+    @classmethod
+    def _is_ancestor(cls, file: BaseFile, directory: Directory) -> bool:
+        """ Returns True if file is directory or one of its ancestors."""
+        cur_dir = directory
+        while cur_dir:
+            if cur_dir is file:
+                return True
+            cur_dir = cur_dir.parent
+        return False
 
-        future_dir, ret_future_dir = self.get_dir(working_dir, future_dir_path)
-        if ret_selected != FileReturnCodes.SUCCESS:
-            return ret_future_dir
-        return selected_file.move(future_dir)
+    def remove_file(self, working_dir: Directory, input_path: str) -> int:
+        """ Removes a file or an empty directory. Root cannot be removed."""
+        with self._mutation():
+            selected_file, ret = self.get_file(working_dir, input_path)
+            if ret != FileReturnCodes.SUCCESS:
+                return ret
+            if selected_file == self.root:
+                return FileReturnCodes.UNSUPPORTED
+            parent = selected_file.parent
+            ret = selected_file.delete()
+            if ret == FileReturnCodes.SUCCESS:
+                self._applied(lambda: parent.add_content(selected_file))
+            return ret
 
     def get_dir(self, working_dir: Directory, input_path: str) -> tuple[Directory, int]:
         base_dir, unmatched = self.get_valid_dir(working_dir, input_path)
@@ -85,17 +518,20 @@ class MemFileSystem(metaclass=VirtualMemDriveRegistry):
         return cur_dir, path_parts[parts_idx:]
 
     def make_file(self, working_dir: Directory, new_dir_path: str, file_type: int) -> FileReturnCodes:
-        valid_base_dir, unmatched_dir = self.get_valid_dir(
-            working_dir, new_dir_path)
-        if len(unmatched_dir) != 1 or not unmatched_dir[0]:
-            return FileReturnCodes.INVALID_PATH
-        file_name = unmatched_dir[0]
-        self._logger(
-            f"Attempting to create file '{file_name}' in {valid_base_dir.absolute_path}")
-        new_file, ret = file_creator_factory(file_name, parent=valid_base_dir)
-        if ret == FileReturnCodes.SUCCESS:
-            return valid_base_dir.add_content(new_file)
-        return ret
+        with self._mutation():
+            valid_base_dir, unmatched_dir = self.get_valid_dir(
+                working_dir, new_dir_path)
+            if len(unmatched_dir) != 1 or not unmatched_dir[0]:
+                return FileReturnCodes.INVALID_PATH
+            file_name = unmatched_dir[0]
+            if DebugLogger.enabled:
+                self._logger(f"Attempting to create file '{file_name}' in {valid_base_dir.absolute_path}")
+            new_file, ret = file_creator_factory(file_name, parent=valid_base_dir)
+            if ret == FileReturnCodes.SUCCESS:
+                ret = valid_base_dir.add_content(new_file)
+            if ret == FileReturnCodes.SUCCESS:
+                self._applied(lambda: valid_base_dir.remove_child(file_name, force_del=True))
+            return ret
 
     def search(self, working_dir: Directory, file_path, regex):
         if not file_path or file_path == ".":
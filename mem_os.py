@@ -0,0 +1,320 @@
+""" os-like programmatic API for an in-mem drive.
+Unlike the command line, nothing is printed. Errors are raised as typed exceptions (see file_return_codes.py)
+and messages are only formatted if the caller asks for them.
+
+    import mem_os
+    mem_os.makedirs(drive, "/movies/disney", exist_ok=True)
+    with mem_os.open(drive, "/movies/disney/nemo.txt", "w") as f:
+        f.write("we found nemo")
+    mem_os.read(drive, "/movies/disney/nemo.txt")
+
+Paths are resolved from the root of the drive.
+"""
+import codecs
+import errno
+import io
+import os
+import stat as stat_module
+from base_file import BaseFile, FileType
+from file_extension_registry import get_extension
+from file_return_codes import FileReturnCodes, MemFSError, UnsupportedError
+from mem_fs import MemFileSystem
+
+_TEXT_ENCODING = "utf-8"
+# Types that hold content and can be opened, read and written.
+_CONTENT_TYPES = (FileType.TEXT_FILE, FileType.BINARY_FILE)
+
+
+class MemFileIO(io.RawIOBase):
+    """ Unbuffered binary stream over a text or binary file. open() wraps it with buffering and decoding.
+    Writes are appended to the file. Text files are read from a utf-8 snapshot taken at the first read.
+    Binary files are read from memoryview slices of the live content without intermediate copies.
+    """
+
+    def __init__(self, drive: MemFileSystem, file: BaseFile, mode: str):
+        super().__init__()
+        self._drive = drive
+        self._file = file
+        self._is_binary = file.type == FileType.BINARY_FILE
+        self._mode = mode
+        self._data = None  # Encoded content. Loaded on first read.
+        self._pos = 0
+        self._decoder = codecs.getincrementaldecoder(_TEXT_ENCODING)()
+        self.name = file.absolute_path
+
+    def readable(self) -> bool:
+        return self._mode == "r"
+
+    def writable(self) -> bool:
+        return self._mode != "r"
+
+    def seekable(self) -> bool:
+        return self.readable()
+
+    def readinto(self, buffer) -> int:
+        self._check_readable()
+        if self._is_binary:
+            with self._file.read(self._pos, len(buffer)) as view:
+                size = len(view)
+                buffer[:size] = view
+            self._pos += size
+            return size
+        data = self._load()
+        size = max(0, min(len(buffer), len(data) - self._pos))
+        buffer[:size] = data[self._pos:self._pos + size]
+        self._pos += size
+        return size
+
+    def seek(self, offset: int, whence=os.SEEK_SET) -> int:
+        self._check_closed()
+        if not self.seekable():
+            raise io.UnsupportedOperation("seek")
+        if whence == os.SEEK_END:
+            base = len(self._file) if self._is_binary else len(self._load())
+        else:
+            base = self._pos if whence == os.SEEK_CUR else 0
+        self._pos = max(0, base + offset)
+        return self._pos
+
+    def tell(self) -> int:
+        self._check_closed()
+        return self._pos
+
+    def write(self, buffer) -> int:
+        self._check_closed()
+        if not self.writable():
+            raise io.UnsupportedOperation("write")
+        if self._is_binary:
+            self._drive.write_to_file(self._file, buffer, write_mode="append", end=b"")
+            return len(buffer)
+        text = self._decoder.decode(bytes(buffer))
+        if text:
+            self._drive.write_to_file(self._file, text, write_mode="append", end="")
+        return len(buffer)
+
+    def close(self):
+        if not self.closed and self.writable() and not self._is_binary:
+            tail = self._decoder.decode(b"", final=True)
+            if tail:
+                self._drive.write_to_file(self._file, tail, write_mode="append", end="")
+        self._data = None
+        super().close()
+
+    def _load(self) -> memoryview:
+        if self._data is None:
+            self._data = memoryview(str(self._file).encode(_TEXT_ENCODING))
+        return self._data
+
+    def _check_readable(self):
+        self._check_closed()
+        if not self.readable():
+            raise io.UnsupportedOperation("read")
+
+    def _check_closed(self):
+        if self.closed:
+            raise ValueError("I/O operation on closed file.")
+
+
+class MemDirEntry:
+    """ Similar to os.DirEntry. Returned by scandir()."""
+
+    def __init__(self, file: BaseFile):
+        self._file = file
+        self.name = file.name
+        self.path = file.absolute_path
+
+    def is_dir(self) -> bool:
+        return self._file.type == FileType.DIR
+
+    def is_file(self) -> bool:
+        return not self.is_dir()
+
+    def stat(self) -> os.stat_result:
+        return _stat(self._file)
+
+    def __repr__(self) -> str:
+        return f"<MemDirEntry '{self.name}'>"
+
+
+def open(drive: MemFileSystem, path: str, mode="r", buffering=-1, encoding=_TEXT_ENCODING, errors=None, newline="\n"):
+    """ Opens a text or binary file. Similar to the builtin open().
+    Supported modes are r, w, a and x with an optional b (binary) or t (text). Text is stored as utf-8.
+    Returns a TextIOWrapper, or a buffered binary stream for binary modes.
+    """
+    modes = set(mode)
+    if len(mode) != len(modes) or not modes <= set("rwaxbt") or len(modes & set("rwax")) != 1 \
+            or {"b", "t"} <= modes:
+        raise ValueError(f"invalid mode: '{mode}'")
+    access = (modes & set("rwax")).pop()
+    file = _open_file(drive, path, access)
+    raw = MemFileIO(drive, file, access)
+    if "b" in modes and buffering == 0:
+        return raw
+    buffer_size = buffering if buffering > 0 else io.DEFAULT_BUFFER_SIZE
+    if access == "r":
+        buffered = io.BufferedReader(raw, buffer_size)
+    else:
+        buffered = io.BufferedWriter(raw, buffer_size)
+    if "b" in modes:
+        return buffered
+    return io.TextIOWrapper(buffered, encoding=encoding, errors=errors, newline=newline)
+
+
+def read(drive: MemFileSystem, path: str):
+    """ Returns the content of a file. str for text files and bytes for binary files."""
+    return _get_file(drive, path, _CONTENT_TYPES).getvalue()
+
+
+def write(drive: MemFileSystem, path: str, data, append=False) -> int:
+    """ Writes data to a file. The file is created if it does not exist. Text files take str. Binary files take
+    bytes-like data or str (stored as utf-8). Raises UnsupportedError, and changes nothing, for bytes to a text file.
+    Returns the number of characters or bytes written.
+    """
+    created = not exists(drive, path)
+    file = _open_file(drive, path, "a")  # Not truncated until the type of data is checked.
+    if file.type == FileType.TEXT_FILE and not isinstance(data, str):
+        if created:
+            drive.remove_file(drive.root, path)
+        raise UnsupportedError(errno.ENOTSUP, "Text files take str, not bytes", path)
+    if data or not append:
+        drive.write_to_file(file, data, write_mode="append" if append else "overwrite", end=data[:0])
+    return len(data)
+
+
+def stat(drive: MemFileSystem, path: str) -> os.stat_result:
+    """ Returns an os.stat_result. st_size is the number of bytes for files, as read by open(): text is counted
+    in utf-8. For directories it is the number of children.
+    """
+    return _stat(_get_file(drive, path))
+
+
+def scandir(drive: MemFileSystem, path="/"):
+    """ Returns an iterator of MemDirEntry objects for the children of a directory."""
+    directory = _get_file(drive, path, (FileType.DIR,))
+    return iter([MemDirEntry(child) for child in directory])
+
+
+def listdir(drive: MemFileSystem, path="/") -> list[str]:
+    return list(_get_file(drive, path, (FileType.DIR,)).children_names())
+
+
+def rename(drive: MemFileSystem, src: str, dst: str):
+    """ Renames or moves src to dst. dst must not exist."""
+    FileReturnCodes.raise_for_code(drive.rename_file(drive.root, src, dst), src)
+
+
+def remove(drive: MemFileSystem, path: str):
+    """ Removes a file. Use rmdir() for directories."""
+    file = _get_file(drive, path)
+    if file.type == FileType.DIR:
+        raise IsADirectoryError(errno.EISDIR, "Is a directory", path)
+    FileReturnCodes.raise_for_code(drive.remove_file(drive.root, path), path)
+
+
+def rmdir(drive: MemFileSystem, path: str):
+    """ Removes an empty directory."""
+    _get_file(drive, path, (FileType.DIR,))
+    FileReturnCodes.raise_for_code(drive.remove_file(drive.root, path), path)
+
+
+def makedirs(drive: MemFileSystem, path: str, exist_ok=False):
+    """ Creates a directory and all missing parents. Nothing is created if a component cannot be a directory."""
+    base_dir, unmatched = drive.get_valid_dir(drive.root, path)
+    if not unmatched:
+        if not exist_ok:
+            raise FileExistsError(errno.EEXIST, "Already exists", path)
+        return
+    # The first missing component can clash with a file. Names with an extension always create files.
+    if base_dir.has_child(unmatched[0]) or any(get_extension(name) for name in unmatched):
+        raise NotADirectoryError(errno.ENOTDIR, "Not a directory", path)
+    for name in unmatched:
+        FileReturnCodes.raise_for_code(
+            drive.make_file(base_dir, name, FileType.DIR), path)
+        base_dir = base_dir.get_child(name)
+
+
+def exists(drive: MemFileSystem, path: str) -> bool:
+    _, ret = drive.get_file(drive.root, path)
+    return ret == FileReturnCodes.SUCCESS
+
+
+def _get_file(drive: MemFileSystem, path: str, types=None) -> BaseFile:
+    """ Resolves path and checks that the file has one of types. None accepts any type."""
+    file, ret = drive.get_file(drive.root, path)
+    FileReturnCodes.raise_for_code(ret, path)
+    if types is None or file.type in types:
+        return file
+    if FileType.DIR in types:
+        raise NotADirectoryError(errno.ENOTDIR, "Not a directory", path)
+    if file.type == FileType.DIR:
+        raise IsADirectoryError(errno.EISDIR, "Is a directory", path)
+    raise MemFSError(errno.ENOTSUP, "Not a text or binary file", path)
+
+
+def _open_file(drive: MemFileSystem, path: str, access: str) -> BaseFile:
+    """ Resolves the file for open(). Creates it for w, a and x. Truncates it for w."""
+    if access != "r":
+        ret = drive.make_file(drive.root, path, FileType.UNKNOWN)
+        if ret == FileReturnCodes.ALREADY_EXIST and access == "x":
+            FileReturnCodes.raise_for_code(ret, path)
+        elif ret not in [FileReturnCodes.SUCCESS, FileReturnCodes.ALREADY_EXIST]:
+            FileReturnCodes.raise_for_code(ret, path)
+    file = _get_file(drive, path, _CONTENT_TYPES)
+    if access == "w":
+        empty = b"" if file.type == FileType.BINARY_FILE else ""
+        drive.write_to_file(file, empty, write_mode="overwrite", end=empty)
+    return file
+
+
+def _stat(file: BaseFile) -> os.stat_result:
+    if file.type == FileType.DIR:
+        mode, size = stat_module.S_IFDIR | 0o755, len(file.children_names())
+    elif file.type == FileType.TEXT_FILE:
+        text = file.getvalue()
+        mode, size = stat_module.S_IFREG | 0o644, len(text) if text.isascii() else len(text.encode(_TEXT_ENCODING))
+    else:
+        mode, size = stat_module.S_IFREG | 0o644, len(file)
+    return os.stat_result((mode, id(file), 0, 1, 0, 0, size, 0, 0, 0))
+
+
+if __name__ == "__main__":
+    drive = MemFileSystem("mem_os_test", register=False)
+    makedirs(drive, "/movies/disney", exist_ok=True)
+    with open(drive, "/movies/disney/nemo.txt", "w") as f:
+        f.write("we found nemo\nand dory\n")
+    with open(drive, "/movies/disney/nemo.txt", "a") as f:
+        f.write("the end")
+    with open(drive, "/movies/disney/nemo.txt") as f:
+        print(f.readlines())
+    print(stat(drive, "/movies/disney/nemo.txt"))
+    rename(drive, "/movies/disney/nemo.txt", "/movies/finding_nemo.txt")
+    print([entry for entry in scandir(drive, "/movies")])
+    try:
+        remove(drive, "/movies/disney/nemo.txt")
+    except FileNotFoundError as e:
+        print("Expected error: ", e)
+    try:
+        makedirs(drive, "/movies/finding_nemo.txt/sequel")
+    except NotADirectoryError as e:
+        print("Expected error: ", e)
+    try:
+        makedirs(drive, "/movies/pixar/cast.txt/voices")
+    except NotADirectoryError as e:
+        print("Expected error: ", e, listdir(drive, "/movies"))
+    write(drive, "/movies/poster.png", b"\x89PNG")
+    print(read(drive, "/movies/poster.png"))
+    # st_size counts the bytes that open() returns.
+    write(drive, "/movies/caf\u00e9.txt", "caf\u00e9")
+    with open(drive, "/movies/caf\u00e9.txt", "rb") as f:
+        assert stat(drive, "/movies/caf\u00e9.txt").st_size == f.seek(0, io.SEEK_END) == 5
+    # bytes to a text file fail before anything is truncated or created.
+    for path in ["/movies/caf\u00e9.txt", "/movies/new.txt"]:
+        try:
+            write(drive, path, b"bytes")
+            assert False, "bytes must not be written to a text file"
+        except UnsupportedError:
+            pass
+    assert read(drive, "/movies/caf\u00e9.txt") == "caf\u00e9" and not exists(drive, "/movies/new.txt")
+    write(drive, "/movies/caf\u00e9.txt", "tea", append=True)
+    assert read(drive, "/movies/caf\u00e9.txt") == "caf\u00e9tea"
+    print("mem_os checks passed.")
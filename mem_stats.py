@@ -0,0 +1,189 @@
+""" Heap accounting for in-mem drives.
+memory_usage() estimates the bytes held by the nodes of a subtree with sys.getsizeof: node objects and their
+attribute dicts, names, children dicts, tombstones, text buffers, line indexes and binary data.
+Content shared by copies is charged to the first file that holds it.
+The allocation profiler uses tracemalloc to attribute allocations made over a time window to the
+MemFileSystem operations that made them.
+"""
+import heapq
+import sys
+from base_file import FileType
+import path_utils
+
+# Bytes per character of a StringIO buffer. CPython stores the text as UCS-4 and getsizeof does not count it.
+_STRINGIO_BYTES_PER_CHAR = 4
+
+
+class MemUsage:
+    """ Estimated memory of a subtree, with a breakdown by file type and by component."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.total_bytes = 0
+        self.num_files = {}  # type name -> number of files.
+        self.by_type = {}  # type name -> bytes.
+        self.by_component = {}  # component -> bytes.
+        self.largest_files = []  # (bytes, path), largest first.
+        self.largest_dirs = []  # (subtree bytes, path), largest first.
+
+    def add(self, file_type: FileType, components: dict):
+        type_name = file_type.name.lower()
+        node_bytes = sum(components.values())
+        self.total_bytes += node_bytes
+        self.num_files[type_name] = self.num_files.get(type_name, 0) + 1
+        self.by_type[type_name] = self.by_type.get(type_name, 0) + node_bytes
+        for component, num_bytes in components.items():
+            self.by_component[component] = self.by_component.get(component, 0) + num_bytes
+        return node_bytes
+
+    def __str__(self) -> str:
+        counts = ", ".join(f"{count:,} {type_name}" for type_name, count in self.num_files.items())
+        lines = [f"Memory under {self.path}: {self.total_bytes:,} bytes in {counts}.",
+                 "By type: " + ", ".join(f"{name}: {num_bytes:,}" for name, num_bytes in self.by_type.items()),
+                 "By component: " + ", ".join(
+                     f"{name}: {num_bytes:,}" for name, num_bytes in self.by_component.items())]
+        for title, entries in [("Largest files:", self.largest_files), ("Largest directories:", self.largest_dirs)]:
+            if entries:
+                lines.append(title)
+            lines.extend(f"{num_bytes:>14,}  {path}" for num_bytes, path in entries)
+        return "\n".join(lines)
+
+
+def memory_usage(file, top_n=10) -> MemUsage:
+    """ Walks the subtree of file and estimates its memory. Directories are charged with their whole subtree
+    in largest_dirs. Only the top_n largest files and directories are kept while walking.
+    """
+    path = file.absolute_path
+    usage = MemUsage(path)
+    top_files, top_dirs = [], []
+    # Post-order walk: a directory is summed after its children. Entries: (node, path, children visited).
+    stack = [(file, path, False)]
+    subtree_bytes = [0]  # Running sums of the open directories.
+    seen = set()  # Ids of shared content that was already charged.
+    while stack:
+        node, node_path, visited = stack.pop()
+        if node.type == FileType.DIR and not visited:
+            subtree_bytes.append(usage.add(node.type, _node_components(node, seen)))
+            stack.append((node, node_path, True))
+            stack.extend((child, path_utils.join(node_path, child.name), False) for child in node)
+            continue
+        if node.type == FileType.DIR:
+            num_bytes = subtree_bytes.pop()
+            _push_top(top_dirs, top_n, num_bytes, node_path)
+        else:
+            num_bytes = usage.add(node.type, _node_components(node, seen))
+            _push_top(top_files, top_n, num_bytes, node_path)
+        subtree_bytes[-1] += num_bytes
+    usage.largest_files = sorted(top_files, reverse=True)
+    usage.largest_dirs = sorted(top_dirs, reverse=True)
+    return usage
+
+
+def _push_top(heap: list, top_n: int, num_bytes: int, path: str):
+    if len(heap) < top_n:
+        heapq.heappush(heap, (num_bytes, path))
+    elif top_n and num_bytes > heap[0][0]:
+        heapq.heapreplace(heap, (num_bytes, path))
+
+
+def _node_components(node, seen: set) -> dict:
+    components = {
+        "nodes": sys.getsizeof(node) + sys.getsizeof(node.__dict__),
+        "names": sys.getsizeof(node.name),
+    }
+    if node.type == FileType.DIR:
+        components["children dicts"] = sys.getsizeof(node._children)
+        if node.tombstones:
+            components["tombstones"] = sys.getsizeof(node.tombstones) + sum(
+                sys.getsizeof(name) for name in node.tombstones)
+    elif node.type == FileType.TEXT_FILE:
+        if node._content is not None:
+            components["text buffers"] = sys.getsizeof(node._content) + _STRINGIO_BYTES_PER_CHAR * len(node)
+            components["line indexes"] = sys.getsizeof(node._newlines)
+        else:
+            components["text buffers"] = _size_once(node._shared, seen)
+            components["line indexes"] = _size_once(node._newlines, seen)
+    elif node.type == FileType.BINARY_FILE:
+        components["binary data"] = _size_once(node._data, seen) if isinstance(node._data, bytes) \
+            else sys.getsizeof(node._data)
+    return components
+
+
+def _size_once(obj, seen: set) -> int:
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    return sys.getsizeof(obj)
+
+
+class AllocationProfiler:
+    """ Attributes the allocations made between start() and stop() to MemFileSystem operations.
+    An allocation is charged to the outermost MemFileSystem method on its stack, i.e. the operation that
+    the caller invoked. Allocations made outside of drive operations are charged to "(other)".
+    Only allocations that are still alive at stop() are reported, so growing entries point at leaks and bloat.
+    If tracemalloc was already tracing, allocations made before start() are included as well.
+    """
+
+    def __init__(self, num_frames=25):
+        self.num_frames = num_frames
+        self._started_tracing = False
+
+    @property
+    def is_running(self) -> bool:
+        import tracemalloc
+        return tracemalloc.is_tracing()
+
+    def start(self):
+        import tracemalloc  # Only imported when profiling.
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.num_frames)
+            self._started_tracing = True
+
+    def stop(self, top_n=10) -> list[tuple[str, int, int]]:
+        """ Returns (operation, bytes, number of blocks) for the top_n operations, largest first."""
+        import tracemalloc
+        snapshot = tracemalloc.take_snapshot()
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+        snapshot = snapshot.filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)])
+        mem_fs_file, operations = _operation_lines()
+        totals = {}  # operation -> [bytes, blocks]
+        for trace in snapshot.traces:
+            operation = "(other)"
+            for frame in trace.traceback:  # Oldest frame first.
+                if frame.filename == mem_fs_file:
+                    operation = _operation_at(operations, frame.lineno) or operation
+                    break
+            total = totals.setdefault(operation, [0, 0])
+            total[0] += trace.size
+            total[1] += 1
+        ranked = sorted(totals.items(), key=lambda item: item[1][0], reverse=True)
+        return [(operation, num_bytes, num_blocks) for operation, (num_bytes, num_blocks) in ranked[:top_n]]
+
+
+_mem_fs_operations = None
+
+
+def _operation_lines():
+    """ Returns the file name of mem_fs and the (first line, last line, name) of each MemFileSystem method."""
+    global _mem_fs_operations
+    if _mem_fs_operations is None:
+        import mem_fs  # Imported here because mem_fs imports this module.
+        ranges = []
+        for name, attr in vars(mem_fs.MemFileSystem).items():
+            fn = attr.fget if isinstance(attr, property) else getattr(attr, "__func__", attr)
+            fn = getattr(fn, "__wrapped__", fn)  # contextmanager
+            code = getattr(fn, "__code__", None)
+            if code is not None:
+                last_line = max(line for _, _, line in code.co_lines() if line is not None)
+                ranges.append((code.co_firstlineno, last_line, name))
+        _mem_fs_operations = (mem_fs.MemFileSystem.__init__.__code__.co_filename, ranges)
+    return _mem_fs_operations
+
+
+def _operation_at(operations: list[tuple[int, int, str]], lineno: int):
+    for first_line, last_line, name in operations:
+        if first_line <= lineno <= last_line:
+            return name
+    return None
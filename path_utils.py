@@ -1,5 +1,9 @@
 """ Some utility functions for handling file paths. """
 from pathlib import PurePosixPath
+import re
+
+# drive:/path, e.g. test:/movies. The path must be absolute.
+_DRIVE_PATH_RE = re.compile(r"^([^/:]+):(/.*)$")
 
 
 def resolve_dots(path: PurePosixPath) -> list[str]:
@@ -36,6 +40,21 @@ def merge_and_deconstruct(abs_base_path: str, path_str: str) -> list[str]:
     return resolve_dots(combined_path)
 
 
+def join(abs_dir_path: str, name: str) -> str:
+    """ Joins an absolute directory path and a file name."""
+    return str(PurePosixPath(abs_dir_path) / name)
+
+
+def split_drive(path_str: str):
+    """ Splits a drive-qualified path such as test:/movies.
+    Returns: (drive name, path). The drive name is None for plain paths.
+    """
+    match = _DRIVE_PATH_RE.match(path_str)
+    if not match:
+        return None, path_str
+    return match.group(1), match.group(2)
+
+
 # TODO(maryamq): Cleanup later. This is for quick testing.
 if __name__ == "__main__":
     print("Absolute: ", merge_and_deconstruct("/", "/world"))
@@ -43,5 +62,6 @@ if __name__ == "__main__":
     print("Relative: ", merge_and_deconstruct("/hello", "world"))
     print("Dots: ", merge_and_deconstruct("/home/alone", "../invasion"))
     print("Dots: ", merge_and_deconstruct("/home/..", "invasion"))
+    print("Drive: ", split_drive("test:/movies"), split_drive("movies/a:b.txt"))
     print("Path to nowhere: ", merge_and_deconstruct(
         "/home/alone", "../../../../nowhere"))
@@ -0,0 +1,206 @@
+""" Loads many command scripts at once. Scripts for different drives run concurrently in worker processes.
+A manifest lists one script per line, prefixed with the drive it targets. Blank lines and # comments are ignored.
+Relative script paths are relative to the manifest:
+
+    # drive   script
+    movies    scripts/movies.txt
+    tv        scripts/tv.txt
+    movies    scripts/movies_extra.txt
+
+A drive can be listed on several lines. All of its scripts run in one worker, in the order of the lines.
+Lines without a drive and a script are reported as errors and skipped.
+
+Each worker receives its drive (a fresh one, or a pickled copy of the registered drive), runs the scripts of
+that drive in their declared order and hands the pickled drive back. The loaded drives replace the registered
+drives of the same name, see MemFileSystem.take_over: watch subscriptions move to the loaded drive, but other
+references to the old drive and its files keep the old tree.
+"""
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout
+import multiprocessing
+import os
+import pickle
+import time
+from environment import Environment
+from file_return_codes import FileReturnCodes
+from logging_utils import DebugLogger
+from mem_fs import MemFileSystem
+import virtual_mem_drive_registry
+
+""" Outcome of a script.
+    errors: messages for invalid lines, failed commands and exceptions.
+    secs: time to run the script.
+"""
+ScriptResult = namedtuple("ScriptResult", ["drive", "path", "errors", "secs"])
+
+
+def read_manifest(manifest_path: str, errors=None) -> dict:
+    """ Returns drive name -> script paths, in declared order.
+    If errors is a list, invalid lines are appended to it as messages and skipped. Otherwise they raise ValueError.
+    """
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+    scripts = {}
+    with open(manifest_path) as f:
+        for line_num, line in enumerate(f, start=1):
+            line = line.split("#", 1)[0].strip()
+            if not line:
+                continue
+            fields = line.split(maxsplit=1)
+            if len(fields) != 2:
+                message = f"line {line_num}: {line}: Expected: drive script_path"
+                if errors is None:
+                    raise ValueError(message)
+                errors.append(message)
+                continue
+            drive_name, script_path = fields
+            scripts.setdefault(drive_name, []).append(os.path.join(base_dir, script_path))
+    return scripts
+
+
+class LoadReport:
+    """ Per-script results and timings of load_all."""
+
+    # Errors printed per script. All errors are kept in results.
+    max_printed_errors = 10
+
+    def __init__(self, results: list[ScriptResult], wall_secs: float, drive_secs: float, num_workers: int,
+                 manifest_errors=()):
+        self.results = results
+        self.wall_secs = wall_secs
+        # Sum of the time each drive took in its worker. An estimate of a sequential load: it does not include
+        # the time to ship drives to and from workers, and workers compete for cores and memory.
+        self.drive_secs = drive_secs
+        self.num_workers = num_workers
+        self.manifest_errors = list(manifest_errors)  # Invalid lines of the manifest.
+
+    @property
+    def num_errors(self) -> int:
+        return len(self.manifest_errors) + sum(len(result.errors) for result in self.results)
+
+    def __str__(self) -> str:
+        num_drives = len({result.drive for result in self.results})
+        speedup = self.drive_secs / self.wall_secs if self.wall_secs else 0
+        lines = [f"Loaded {num_drives} drive(s) from {len(self.results)} script(s) with {self.num_workers} "
+                 f"worker(s) in {self.wall_secs:.3f}s. Sum of drive times: {self.drive_secs:.3f}s "
+                 f"({speedup:.1f}x). {self.num_errors} error(s)."]
+        if self.manifest_errors:
+            lines.append(f"  manifest: {len(self.manifest_errors)} error(s)")
+            lines.extend(f"    {error}" for error in self.manifest_errors)
+        for result in self.results:
+            lines.append(f"  {result.drive}: {result.path}: {len(result.errors)} error(s) in {result.secs:.3f}s")
+            lines.extend(f"    {error}" for error in result.errors[:LoadReport.max_printed_errors])
+            if len(result.errors) > LoadReport.max_printed_errors:
+                lines.append(f"    ... and {len(result.errors) - LoadReport.max_printed_errors} more")
+        return "\n".join(lines)
+
+
+def load_all(manifest_path: str, num_workers=None, start_method=None) -> tuple[LoadReport, int]:
+    """ Runs the scripts of a manifest and registers the loaded drives.
+    Arguments:
+    manifest_path: path of the manifest on disk.
+    num_workers: number of worker processes. Defaults to the number of cores. 0 runs all drives in this
+      process, one after another.
+    start_method: multiprocessing start method. Defaults to the platform default.
+    Returns: (LoadReport, return code). INVALID_PATH if the manifest or a script does not exist.
+    """
+    manifest_errors = []
+    scripts = read_manifest(manifest_path, manifest_errors)
+    if not all(os.path.exists(path) for paths in scripts.values() for path in paths):
+        return None, FileReturnCodes.INVALID_PATH
+    tasks = [(drive_name, _drive_image(drive_name), paths) for drive_name, paths in scripts.items()]
+    num_workers = min(os.cpu_count() or 1, len(tasks)) if num_workers is None else min(num_workers, len(tasks))
+    start = time.perf_counter()
+    if num_workers:
+        context = multiprocessing.get_context(start_method)
+        with ProcessPoolExecutor(num_workers, mp_context=context) as executor:
+            outcomes = list(executor.map(_load_drive, *zip(*tasks)))
+    else:
+        outcomes = [_load_drive(*task) for task in tasks]
+    results, total_drive_secs = [], 0.0
+    for image, drive_results, drive_secs in outcomes:
+        drive = pickle.loads(image)
+        old_drive = virtual_mem_drive_registry.registry.get(drive.name)
+        if old_drive is not None:
+            drive.take_over(old_drive)
+        virtual_mem_drive_registry.add_drive(drive)
+        results.extend(drive_results)
+        total_drive_secs += drive_secs
+    report = LoadReport(results, time.perf_counter() - start, total_drive_secs, num_workers, manifest_errors)
+    return report, FileReturnCodes.SUCCESS
+
+
+def _drive_image(drive_name: str):
+    """ Returns the pickled registered drive, or None if there is no such drive."""
+    drive, ret = virtual_mem_drive_registry.mount(drive_name)
+    return pickle.dumps(drive, protocol=pickle.HIGHEST_PROTOCOL) if ret == FileReturnCodes.SUCCESS else None
+
+
+def _load_drive(drive_name: str, image, script_paths: list[str]):
+    """ Runs in a worker. Builds the drive, runs its scripts in order and returns the pickled drive.
+    Returns: (pickled drive, list of ScriptResult, secs)
+    """
+    from main import execute_commands_from_file  # main is the CLI. Only workers need it.
+    start = time.perf_counter()
+    drive = pickle.loads(image) if image else MemFileSystem(drive_name, register=False)
+    env = Environment(enable_debug_logging=DebugLogger.enabled)
+    env.current_drive = drive
+    results = []
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        for path in script_paths:
+            script_start = time.perf_counter()
+            errors = []
+            execute_commands_from_file(env, path, errors)
+            results.append(ScriptResult(drive_name, path, errors, time.perf_counter() - script_start))
+    virtual_mem_drive_registry.unpin(env.current_drive.name)
+    image = pickle.dumps(drive, protocol=pickle.HIGHEST_PROTOCOL)
+    drive.disable_text_index()  # The loaded copy has its own index. This one is dropped.
+    return image, results, time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    import shutil
+    import tempfile
+    import text_index
+
+    script_dir = tempfile.mkdtemp(prefix="toymemfs_load_")
+    scripts = {
+        "movies_1.txt": "mk /movies\nmk /movies/nemo.txt\nwrite /movies/nemo.txt found\n",
+        "tv.txt": "mk /tv\n",
+        "movies_2.txt": "write /movies/nemo.txt -a again\n",  # Needs movies_1.txt to run first.
+        "manifest.txt": "movies movies_1.txt\ntv tv.txt\nmovies_3.txt\nmovies movies_2.txt  # same drive\n",
+    }
+    for name, content in scripts.items():
+        with open(os.path.join(script_dir, name), "w") as f:
+            f.write(content)
+    manifest_path = os.path.join(script_dir, "manifest.txt")
+    try:
+        read_manifest(manifest_path)
+        assert False, "A line without a script must raise."
+    except ValueError as e:
+        assert "line 3" in str(e)
+
+    for num_workers in [2, 0]:
+        old_drive = MemFileSystem("movies")
+        old_drive.enable_text_index()
+        num_indexes = text_index.active_indexes
+        subscription = old_drive.watch("/")
+        report, ret = load_all(manifest_path, num_workers)
+        assert ret == FileReturnCodes.SUCCESS and report.num_errors == 1, str(report)
+        assert report.manifest_errors[0].startswith("line 3: movies_3.txt")
+        # Scripts of one drive run in the order of the manifest, whatever lines are in between.
+        assert [os.path.basename(result.path) for result in report.results if result.drive == "movies"] == \
+            ["movies_1.txt", "movies_2.txt"]
+        drive, _ = virtual_mem_drive_registry.mount("movies")
+        nemo, _ = drive.get_file(drive.root, "/movies/nemo.txt")
+        assert drive is not old_drive and nemo.getvalue() == "found\nagain\n"
+        assert text_index.active_indexes == num_indexes and drive.search_text(["again"])[0] == ["/movies/nemo.txt"]
+        # Subscribers of the replaced drive receive the events of the loaded one.
+        drive.write_file(drive.root, "/movies/nemo.txt", "replaced")
+        event = subscription.get(timeout=1)
+        assert (event.kind, event.path) == ("write", "/movies/nemo.txt"), event
+        subscription.close()
+        virtual_mem_drive_registry.drop("movies")
+        virtual_mem_drive_registry.drop("tv")
+    shutil.rmtree(script_dir)
+    print("script_loader: all checks passed.")
@@ -0,0 +1,384 @@
+""" Sharded drive: partitions the namespace of a drive across worker processes.
+Each worker holds its own MemFileSystem shard with a subset of the top-level entries. Placement is by a
+hash of the top-level name, or explicit with `placement`. The router in the main process exposes the
+path-based equivalent of the MemFileSystem API, fans out subtree-wide operations over all shards and
+merges the results. Moves across shards transplant the pickled subtree.
+
+Objects cannot cross process boundaries, so paths are strings and files are returned as FileInfo tuples.
+
+    with ShardedMemFileSystem("big", num_shards=4) as drive:
+        drive.make_file("/", "/movies", FileType.DIR)
+        drive.search("/", "/", "nemo")
+"""
+from collections import namedtuple, deque
+import multiprocessing
+import os
+import pickle
+import zlib
+from base_file import FileType
+from file_return_codes import FileReturnCodes
+from logging_utils import DebugLogger
+from mem_fs import MemFileSystem
+import path_utils
+
+""" Description of a file in a shard.
+    size: characters for text files, bytes for binary files, number of children for directories.
+"""
+FileInfo = namedtuple("FileInfo", ["name", "path", "type", "size"])
+
+
+class _ShardWorker:
+    """ Runs in a worker process and applies requests to its shard. All paths are absolute."""
+
+    def __init__(self, name: str):
+        self._drive = MemFileSystem(name, register=False)
+
+    def get_file(self, path, type=FileType.UNKNOWN):
+        file, ret = self._drive.get_file(self._drive.root, path, type=type)
+        return (_file_info(file) if file else None), ret
+
+    def make_file(self, path, file_type):
+        return self._drive.make_file(self._drive.root, path, file_type)
+
+    def write_file(self, path, content, write_mode="overwrite"):
+        return self._drive.write_file(self._drive.root, path, content, write_mode=write_mode)
+
+    def read_file(self, path):
+        file, ret = self._drive.get_file(self._drive.root, path)
+        if ret != FileReturnCodes.SUCCESS or file.type == FileType.DIR:
+            return None, FileReturnCodes.INVALID_PATH
+        return file.getvalue(), ret
+
+    def remove_file(self, path):
+        return self._drive.remove_file(self._drive.root, path)
+
+    def move_file(self, path, future_dir_path):
+        return self._drive.move_file(self._drive.root, path, future_dir_path)
+
+    def search(self, path, regex):
+        return self._drive.search(self._drive.root, path, regex)
+
+    def list_dir(self, path):
+        directory, ret = self._drive.get_dir(self._drive.root, path)
+        if ret != FileReturnCodes.SUCCESS:
+            return [], ret
+        return list(directory.children_names()), ret
+
+    def can_attach(self, dir_path, name):
+        directory, ret = self._drive.get_dir(self._drive.root, dir_path)
+        if ret != FileReturnCodes.SUCCESS:
+            return ret
+        return FileReturnCodes.ALREADY_EXIST if name in directory else FileReturnCodes.SUCCESS
+
+    def detach(self, path):
+        """ Removes a subtree and returns it pickled."""
+        file, ret = self._drive.get_file(self._drive.root, path)
+        if ret != FileReturnCodes.SUCCESS:
+            return None, ret
+        if file == self._drive.root:
+            return None, FileReturnCodes.UNSUPPORTED
+        file.parent.remove_child(file.name, force_del=True)
+        file.parent = None
+        return pickle.dumps(file, protocol=pickle.HIGHEST_PROTOCOL), ret
+
+    def attach(self, dir_path, blob):
+        directory, ret = self._drive.get_dir(self._drive.root, dir_path)
+        if ret != FileReturnCodes.SUCCESS:
+            return ret
+        return directory.add_content(pickle.loads(blob))
+
+    def dump(self):
+        return str(self._drive)
+
+
+def _worker_main(conn, name):
+    DebugLogger.enabled = False
+    worker = _ShardWorker(name)
+    while True:
+        request = conn.recv()
+        if request is None:
+            break
+        method, args = request
+        try:
+            conn.send((True, getattr(worker, method)(*args)))
+        except Exception as e:  # Surface errors in the router instead of killing the worker.
+            conn.send((False, e))
+    conn.close()
+
+
+class ShardedMemFileSystem:
+    """ Router for a drive that is sharded over worker processes."""
+
+    # Max requests in flight per shard in execute_many.
+    _pipeline_window = 64
+
+    def __init__(self, name: str, num_shards=None, placement=None, start_method=None):
+        """ Starts the workers.
+        Arguments:
+        name: name of the drive.
+        num_shards: number of worker processes. Defaults to the number of cores.
+        placement: optional dict of top-level name -> shard index. Other names are placed by hash.
+        start_method: multiprocessing start method. Defaults to the platform default.
+        """
+        self._name = name
+        self._num_shards = num_shards or os.cpu_count() or 1
+        self._placement = placement or {}
+        context = multiprocessing.get_context(start_method)
+        self._conns = []
+        self._processes = []
+        for idx in range(self._num_shards):
+            parent_conn, child_conn = context.Pipe()
+            process = context.Process(target=_worker_main, args=(child_conn, f"{name}_{idx}"), daemon=True)
+            process.start()
+            child_conn.close()
+            self._conns.append(parent_conn)
+            self._processes.append(process)
+        self._logger = DebugLogger.get_logger_fn("ShardedMemFileSystem_" + name)
+
+    @property
+    def name(self):
+        return self._name
+
+    @property
+    def num_shards(self):
+        return self._num_shards
+
+    def shard_for(self, path: str):
+        """ Returns the shard index that holds path, or None for the root."""
+        parts = path_utils.merge_and_deconstruct(MemFileSystem.ROOT_DIR, path)
+        if len(parts) < 2:
+            return None
+        top = parts[1]
+        if top in self._placement:
+            return self._placement[top]
+        return zlib.crc32(top.encode()) % self._num_shards
+
+    def get_file(self, working_dir: str, input_path: str, type=FileType.UNKNOWN) -> tuple[FileInfo, int]:
+        path = self._resolve(working_dir, input_path)
+        if path is None:
+            return None, FileReturnCodes.INVALID_PATH
+        if path == MemFileSystem.ROOT_DIR:
+            if type not in [FileType.UNKNOWN, FileType.DIR]:
+                return None, FileReturnCodes.INVALID_PATH
+            names, _ = self.list_dir(MemFileSystem.ROOT_DIR, path)
+            return FileInfo(path, path, FileType.DIR, len(names)), FileReturnCodes.SUCCESS
+        return self._call(self.shard_for(path), "get_file", path, type)
+
+    def get_dir(self, working_dir: str, input_path: str) -> tuple[FileInfo, int]:
+        return self.get_file(working_dir, input_path, type=FileType.DIR)
+
+    def make_file(self, working_dir: str, new_path: str, file_type) -> int:
+        path = self._resolve(working_dir, new_path)
+        if path is None or path == MemFileSystem.ROOT_DIR:
+            return FileReturnCodes.INVALID_PATH
+        return self._call(self.shard_for(path), "make_file", path, file_type)
+
+    def write_file(self, working_dir: str, input_path: str, content, write_mode="overwrite") -> int:
+        path = self._resolve(working_dir, input_path)
+        if path is None or path == MemFileSystem.ROOT_DIR:
+            return FileReturnCodes.INVALID_PATH
+        return self._call(self.shard_for(path), "write_file", path, content, write_mode)
+
+    def read_file(self, working_dir: str, input_path: str):
+        """ Returns (content, return code). content is str for text files and bytes for binary files."""
+        path = self._resolve(working_dir, input_path)
+        if path is None or path == MemFileSystem.ROOT_DIR:
+            return None, FileReturnCodes.INVALID_PATH
+        return self._call(self.shard_for(path), "read_file", path)
+
+    def remove_file(self, working_dir: str, input_path: str) -> int:
+        path = self._resolve(working_dir, input_path)
+        if path is None:
+            return FileReturnCodes.INVALID_PATH
+        if path == MemFileSystem.ROOT_DIR:
+            return FileReturnCodes.UNSUPPORTED
+        return self._call(self.shard_for(path), "remove_file", path)
+
+    def list_dir(self, working_dir: str, input_path: str):
+        """ Returns (names, return code). Listing the root merges all shards."""
+        path = self._resolve(working_dir, input_path)
+        if path is None:
+            return [], FileReturnCodes.INVALID_PATH
+        if path != MemFileSystem.ROOT_DIR:
+            return self._call(self.shard_for(path), "list_dir", path)
+        names = []
+        for shard_names, _ in self._fan_out("list_dir", path):
+            names.extend(shard_names)
+        return names, FileReturnCodes.SUCCESS
+
+    def search(self, working_dir: str, file_path: str, regex):
+        """ Same as MemFileSystem.search. Searches under the root run on all shards in parallel."""
+        path = self._resolve(working_dir, file_path or ".")
+        if path is None:
+            return [], FileReturnCodes.INVALID_PATH
+        if path != MemFileSystem.ROOT_DIR:
+            return self._call(self.shard_for(path), "search", path, regex)
+        results = []
+        for shard_results, _ in self._fan_out("search", path, regex):
+            results.extend(shard_results)
+        return results, FileReturnCodes.SUCCESS
+
+    def move_file(self, working_dir: str, current_path: str, future_dir_path: str) -> int:
+        """ Moves a file or directory to a new directory. Moves across shards transplant the subtree."""
+        path = self._resolve(working_dir, current_path)
+        future_dir = self._resolve(working_dir, future_dir_path)
+        if path is None or future_dir is None:
+            return FileReturnCodes.INVALID_PATH
+        if path == MemFileSystem.ROOT_DIR:
+            return FileReturnCodes.UNSUPPORTED
+        name = path.rsplit("/", 1)[-1]
+        src_shard = self.shard_for(path)
+        dst_shard = self.shard_for(path_utils.join(future_dir, name))
+        if src_shard == dst_shard:
+            return self._call(src_shard, "move_file", path, future_dir)
+
+        if future_dir != MemFileSystem.ROOT_DIR:
+            _, ret = self.get_dir(MemFileSystem.ROOT_DIR, future_dir)
+            if ret != FileReturnCodes.SUCCESS:
+                return ret
+        ret = self._call(dst_shard, "can_attach", future_dir, name)
+        if ret != FileReturnCodes.SUCCESS:
+            return ret
+        blob, ret = self._call(src_shard, "detach", path)
+        if ret != FileReturnCodes.SUCCESS:
+            return ret
+        ret = self._call(dst_shard, "attach", future_dir, blob)
+        if ret != FileReturnCodes.SUCCESS:  # Put it back.
+            self._call(src_shard, "attach", path.rsplit("/", 1)[0] or MemFileSystem.ROOT_DIR, blob)
+        self._logger(f"Moved {path} from shard {src_shard} to shard {dst_shard}")
+        return ret
+
+    def execute_many(self, operations) -> list:
+        """ Runs a batch of operations and returns their results in order.
+        operations: list of (method name, args) such as ("make_file", ("/", "/a", FileType.DIR)).
+        Operations on different shards run in parallel. Operations on the same shard keep their order.
+        Root-wide operations and moves wait for all earlier operations.
+        """
+        results = [None] * len(operations)
+        pending = [deque() for _ in range(self._num_shards)]
+        for idx, (method, args) in enumerate(operations):
+            shard = self._shard_local_target(method, args)
+            if shard is None:
+                self._drain(pending, results)
+                results[idx] = getattr(self, method)(*args)
+            else:
+                path = self._resolve(args[0], args[1])
+                pending[shard].append((idx, method, (path,) + tuple(args[2:])))
+        self._drain(pending, results)
+        return results
+
+    def close(self):
+        """ Stops the workers. The content of the drive is discarded."""
+        for conn in self._conns:
+            try:
+                conn.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+        for process in self._processes:
+            process.join(timeout=5)
+        self._conns, self._processes = [], []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __str__(self) -> str:
+        dumps = self._fan_out("dump")
+        return "".join(f"shard {idx}:\n{dump}" for idx, dump in enumerate(dumps))
+
+    def _shard_local_target(self, method, args):
+        """ Returns the shard for operations that touch a single shard. None otherwise."""
+        if method not in ["get_file", "make_file", "write_file", "read_file", "remove_file", "search",
+                          "list_dir"]:
+            return None
+        path = self._resolve(args[0], args[1])
+        if path is None or path == MemFileSystem.ROOT_DIR:
+            return None
+        return self.shard_for(path)
+
+    def _drain(self, pending, results):
+        """ Pipelines queued requests to all shards and collects the responses.
+        If a request raises, queued requests are dropped, replies in flight are read and the first error is raised.
+        """
+        in_flight = [deque() for _ in range(self._num_shards)]
+        error = None
+        while any(pending) or any(in_flight):
+            for shard, queue in enumerate(pending):
+                while queue and len(in_flight[shard]) < ShardedMemFileSystem._pipeline_window:
+                    idx, method, args = queue.popleft()
+                    self._conns[shard].send((method, args))
+                    in_flight[shard].append(idx)
+            for shard, indexes in enumerate(in_flight):
+                if indexes:
+                    idx = indexes.popleft()
+                    ok, result = self._conns[shard].recv()
+                    if ok:
+                        results[idx] = result
+                    elif error is None:
+                        error = result
+                        for queue in pending:
+                            queue.clear()
+        if error is not None:
+            raise error
+
+    def _resolve(self, working_dir: str, input_path: str):
+        """ Returns the absolute path, or None if the path leads above the root."""
+        parts = path_utils.merge_and_deconstruct(working_dir, input_path)
+        if not parts:
+            return None
+        return MemFileSystem.ROOT_DIR + "/".join(parts[1:])
+
+    def _call(self, shard: int, method: str, *args):
+        self._conns[shard].send((method, args))
+        return self._receive(shard)
+
+    def _fan_out(self, method: str, *args) -> list:
+        """ Sends a request to every shard. All replies are read before an error is raised, so no reply is
+        left in a pipe to be mistaken for the answer to a later request.
+        """
+        for conn in self._conns:
+            conn.send((method, args))
+        replies = [conn.recv() for conn in self._conns]
+        return [ShardedMemFileSystem._unwrap(reply) for reply in replies]
+
+    def _receive(self, shard: int):
+        return ShardedMemFileSystem._unwrap(self._conns[shard].recv())
+
+    @classmethod
+    def _unwrap(cls, reply):
+        ok, result = reply
+        if not ok:
+            raise result
+        return result
+
+
+def _file_info(file) -> FileInfo:
+    size = len(file.children_names()) if file.type == FileType.DIR else len(file)
+    return FileInfo(file.name, file.absolute_path, file.type, size)
+
+
+if __name__ == "__main__":
+    import re
+    with ShardedMemFileSystem("sharded_test", num_shards=3) as drive:
+        for top in ["movies", "tv", "music", "books"]:
+            print(top, drive.make_file("/", top, FileType.DIR), "shard", drive.shard_for(top))
+        print(drive.make_file("/movies", "disney", FileType.DIR))
+        print(drive.make_file("/movies/disney", "nemo.txt", FileType.TEXT_FILE))
+        print(drive.write_file("/", "/movies/disney/nemo.txt", "we found nemo"))
+        print(drive.list_dir("/", "/"))
+        print("Cross-shard move: ", drive.move_file("/", "/movies/disney", "/tv"))
+        print(drive.read_file("/tv/disney", "nemo.txt"))
+        print(drive.search("/", "/", "nemo"))
+        print(drive)
+        # A failing fan-out must not leave replies behind for later calls.
+        expected_search, expected_list = drive.search("/", "/", "d"), drive.list_dir("/", "/tv")
+        for operations in [None, [("search", ("/", "/movies", "(")), ("list_dir", ("/", "/tv"))]]:
+            try:
+                drive.search("/", "/", "(") if operations is None else drive.execute_many(operations)
+                raise AssertionError("Expected an invalid regex error.")
+            except re.error as e:
+                print("Expected error: ", e)
+            assert drive.search("/", "/", "d") == expected_search, "Out of sync after a failed request."
+            assert drive.list_dir("/", "/tv") == expected_list
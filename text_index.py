@@ -0,0 +1,235 @@
+""" Optional token-level inverted index over the text files of a drive.
+TextFile and Directory keep the index up to date incrementally: appends only index the new text, overwrites
+re-index the file, and detached subtrees are removed. Queries are answered from posting lists.
+Postings are keyed by file object, so moves and renames within a drive need no index updates.
+"""
+from collections import Counter
+import re
+import sys
+import time
+from base_file import FileType
+
+_TOKEN_RE = re.compile(r"\w+")
+# \Z, not $: $ also matches before a final newline, which would glue the next append to the last word.
+_TRAILING_TOKEN_RE = re.compile(r"\w+\Z")
+
+# Number of drives with an enabled index. Mutation points skip all index work when it is 0.
+active_indexes = 0
+
+
+def tokenize(text: str) -> list[str]:
+    return [token.lower() for token in _TOKEN_RE.findall(text)]
+
+
+def on_write(file, text: str, append: bool):
+    """ Called by text files after a write. text is the appended text, or the full content on overwrite."""
+    index = _index_for(file)
+    if index is not None:
+        index.append(file, text) if append else index.replace(file, text)
+
+
+def on_attach(file):
+    """ Called when a file or subtree is attached to a directory."""
+    index = _index_for(file)
+    if index is not None:
+        index.add_subtree(file)
+
+
+def on_detach(parent, file):
+    """ Called before a file or subtree is detached from parent."""
+    index = _index_for(parent)
+    if index is not None:
+        index.remove_subtree(file)
+
+
+def _index_for(file):
+    drive = file.drive
+    return drive.text_index if drive else None
+
+
+class TextIndex:
+    """ Maps tokens to the text files that contain them. Tokens are lower-cased words."""
+
+    def __init__(self):
+        self._postings = {}  # token -> {file: count}
+        self._file_tokens = {}  # file -> Counter of tokens
+        self._tails = {}  # file -> trailing word of the file. An append can extend it.
+        self.num_updates = 0
+        self.update_secs = 0.0
+
+    def __len__(self):
+        """ Returns the number of distinct tokens."""
+        return len(self._postings)
+
+    def append(self, file, text: str):
+        """ Indexes text appended to file. A word split across appends is indexed once, as a whole."""
+        start = time.perf_counter()
+        self._append(file, text)
+        self._record_update(start)
+
+    def replace(self, file, text: str):
+        """ Re-indexes file with its full content."""
+        start = time.perf_counter()
+        self._remove_file(file)
+        self._append(file, text)
+        self._record_update(start)
+
+    def add_subtree(self, file):
+        if file.type == FileType.TEXT_FILE:
+            self.replace(file, file.getvalue())
+        elif file.type == FileType.DIR:
+            for child in file:
+                self.add_subtree(child)
+
+    def remove_subtree(self, file):
+        if file.type == FileType.TEXT_FILE:
+            self._remove_file(file)
+        elif file.type == FileType.DIR:
+            for child in file:
+                self.remove_subtree(child)
+
+    def lookup(self, token: str) -> set:
+        """ Returns the files that contain token."""
+        return set(self._postings.get(token.lower(), ()))
+
+    def query(self, terms: list[str], mode="and") -> set:
+        """ Returns the files that match all (mode=and) or any (mode=or) of the terms.
+        A term with several words is a phrase. Phrases are verified against the file content.
+        """
+        matches = None
+        for term in terms:
+            files = self._phrase(term)
+            if matches is None:
+                matches = files
+            elif mode == "or":
+                matches |= files
+            else:
+                matches &= files
+        return matches or set()
+
+    def stats(self) -> dict:
+        """ Reports the size of the index and the cost of updates.
+        memory_bytes is an estimate of the dicts, token strings and counters held by the index.
+        """
+        memory = sys.getsizeof(self._postings) + sys.getsizeof(self._file_tokens) + sys.getsizeof(self._tails)
+        memory += sum(sys.getsizeof(token) + sys.getsizeof(files) for token, files in self._postings.items())
+        memory += sum(sys.getsizeof(tokens) for tokens in self._file_tokens.values())
+        memory += sum(sys.getsizeof(tail) for tail in self._tails.values())
+        return {
+            "tokens": len(self._postings),
+            "postings": sum(len(files) for files in self._postings.values()),
+            "files": len(self._file_tokens),
+            "memory_bytes": memory,
+            "updates": self.num_updates,
+            "avg_update_usecs": 1e6 * self.update_secs / self.num_updates if self.num_updates else 0.0,
+        }
+
+    def _phrase(self, phrase: str) -> set:
+        tokens = tokenize(phrase)
+        if not tokens:
+            return set()
+        # Smallest posting list first.
+        tokens.sort(key=lambda token: len(self._postings.get(token, ())))
+        candidates = self.lookup(tokens[0])
+        for token in tokens[1:]:
+            candidates &= self._postings.get(token, {}).keys()
+        if len(tokens) == 1:
+            return candidates
+        phrase_re = re.compile(r"\b" + r"\W+".join(re.escape(token) for token in tokenize(phrase)) + r"\b",
+                               re.IGNORECASE)
+        return {file for file in candidates if phrase_re.search(file.getvalue())}
+
+    def _append(self, file, text: str):
+        tail = self._tails.get(file, "")
+        if tail:
+            self._remove_tokens(file, Counter([tail.lower()]))
+        text = tail + text
+        self._add_tokens(file, Counter(tokenize(text)))
+        trailing = _TRAILING_TOKEN_RE.search(text)
+        self._tails[file] = trailing.group() if trailing else ""
+
+    def _add_tokens(self, file, tokens: Counter):
+        self._file_tokens.setdefault(file, Counter()).update(tokens)
+        for token, count in tokens.items():
+            files = self._postings.setdefault(token, {})
+            files[file] = files.get(file, 0) + count
+
+    def _remove_tokens(self, file, tokens: Counter):
+        file_tokens = self._file_tokens.get(file)
+        if file_tokens is None:
+            return
+        file_tokens.subtract(tokens)
+        for token, count in tokens.items():
+            files = self._postings.get(token)
+            if not files or file not in files:
+                continue
+            files[file] -= count
+            if files[file] <= 0:
+                del files[file]
+                del file_tokens[token]
+                if not files:
+                    del self._postings[token]
+
+    def _remove_file(self, file):
+        tokens = self._file_tokens.pop(file, None)
+        self._tails.pop(file, None)
+        if not tokens:
+            return
+        for token in tokens:
+            files = self._postings.get(token)
+            if files and file in files:
+                del files[file]
+                if not files:
+                    del self._postings[token]
+
+    def _record_update(self, start: float):
+        self.num_updates += 1
+        self.update_secs += time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    from mem_fs import MemFileSystem
+    drive = MemFileSystem("index_test", register=False)
+    drive.enable_text_index()
+    drive.make_file(drive.root, "/log.txt", FileType.TEXT_FILE)
+
+    def search(*terms):
+        return drive.search_text(list(terms))[0]
+
+    # Appends with the default end="\n" start a new word.
+    drive.write_file(drive.root, "/log.txt", "apple")
+    drive.write_file(drive.root, "/log.txt", "banana split", write_mode="append")
+    assert search("apple") == ["/log.txt"] and search("banana") == ["/log.txt"] and not search("applebanana")
+    # A word split across appends without a separator is indexed once, as a whole.
+    drive.write_file(drive.root, "/log.txt", "straw", write_mode="append", end="")
+    drive.write_file(drive.root, "/log.txt", "berry jam", write_mode="append")
+    assert search("strawberry") == ["/log.txt"] and not search("straw") and not search("berry")
+    # Appends after a non-word character never merge.
+    drive.write_file(drive.root, "/log.txt", "kiwi.", write_mode="append", end="")
+    drive.write_file(drive.root, "/log.txt", "lime", write_mode="append")
+    assert search("kiwi") == search("lime") == ["/log.txt"] and not search("kiwilime")
+    # Overwrites drop the old tokens.
+    drive.write_file(drive.root, "/log.txt", "cherry")
+    assert search("cherry") == ["/log.txt"] and not search("apple")
+    # Unmounted, evicted and dropped drives stop counting. Remounts count again.
+    import text_index  # The module that drives update, not __main__.
+    import virtual_mem_drive_registry
+    from file_return_codes import FileReturnCodes
+    start_count = text_index.active_indexes
+    indexed = MemFileSystem("indexed")
+    indexed.enable_text_index()
+    for _ in range(3):
+        assert virtual_mem_drive_registry.unmount("indexed") == FileReturnCodes.SUCCESS
+        assert text_index.active_indexes == start_count
+        indexed, _ = virtual_mem_drive_registry.mount("indexed")
+        assert text_index.active_indexes == start_count + 1
+        assert indexed.search_text(["x"])[1] == FileReturnCodes.SUCCESS  # The image kept the index.
+    virtual_mem_drive_registry.set_max_resident_drives(1)
+    MemFileSystem("newer")  # Evicts indexed.
+    assert not virtual_mem_drive_registry.is_resident("indexed") and text_index.active_indexes == start_count
+    virtual_mem_drive_registry.set_max_resident_drives(None)
+    virtual_mem_drive_registry.mount("indexed")
+    virtual_mem_drive_registry.drop("indexed")
+    assert text_index.active_indexes == start_count
+    print("Index checks passed:", drive.text_index.stats())
+
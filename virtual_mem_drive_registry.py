@@ -1,16 +1,209 @@
+""" Registry of virtual in-mem drives.
+Drives are either resident (a live MemFileSystem in `registry`) or stored (known by name, but kept
+as a persisted image on disk until they are mounted). A cap on resident drives evicts idle drives
+back to storage in LRU order, so a process can host many drives with a bounded working set.
+"""
+from collections import OrderedDict
+import os
 from logging_utils import DebugLogger
-# Global registry of all in-mem filesystems.
-registry = {}
+from file_return_codes import FileReturnCodes
+
+# Global registry of all resident in-mem filesystems. Ordered from least to most recently used.
+registry = OrderedDict()
+
+# Drives that are registered by name but live in a persisted image. name -> image path.
+stored_drives = {}
+
+# Max number of resident drives. None means unbounded.
+max_resident_drives = None
+
+# Evicted and unmounted drives are persisted here. None means a private temp dir, created on first use
+# and removed at exit. Each process gets its own, so concurrent processes never overwrite each other's images.
+storage_dir = None
+
+# Watch hubs of stored drives that still have subscriptions. Hubs are not persisted, so they are reattached
+# when the drive is mounted again. name -> WatchHub
+_detached_hubs = {}
+
+# Drives that are in use (e.g. mounted by an Environment) and must not be evicted. name -> count.
+_pinned = {}
+
+_logger = DebugLogger.get_logger_fn("VirtualMemDriveRegistry")
 
 
 class VirtualMemDriveRegistry(type):
-    """ Bare-bones registry system. This enables creating multiple virtual in-mem drives. 
-        This enables multiple in-mem filesystems. 
-        TODO(maryamq): Currently, there is no way to de-register a drive (P2).
+    """ Bare-bones registry system. This enables creating multiple virtual in-mem drives.
+        Every drive is registered at creation. Pass register=False to create a private drive.
     """
-    _logger = DebugLogger.get_logger_fn("VirtualMemDriveRegistry")
-    def __call__(cls, *args, **kwargs):
+
+    def __call__(cls, *args, register=True, **kwargs):
         obj = type.__call__(cls, *args, **kwargs)
-        registry[obj.name] = obj
-        VirtualMemDriveRegistry._logger(f"Registered a new drive: {obj.name}")
+        if register:
+            add_drive(obj)
+            _logger(f"Registered a new drive: {obj.name}")
         return obj
+
+
+def add_drive(drive):
+    """ Adds a resident drive as the most recently used one. Replaces a drive with the same name."""
+    stored_drives.pop(drive.name, None)
+    registry[drive.name] = drive
+    registry.move_to_end(drive.name)
+    _evict_idle(keep=drive.name)  # The caller has not pinned the drive yet.
+
+
+def register_lazy(name: str, image_path: str) -> int:
+    """ Registers a drive by name. It is loaded from image_path when it is first mounted."""
+    if is_registered(name):
+        return FileReturnCodes.ALREADY_EXIST
+    stored_drives[name] = image_path
+    return FileReturnCodes.SUCCESS
+
+
+def is_registered(name: str) -> bool:
+    return name in registry or name in stored_drives
+
+
+def is_resident(name: str) -> bool:
+    return name in registry
+
+
+def drive_names() -> list[str]:
+    """ Returns names of all resident and stored drives."""
+    return list(registry.keys()) + list(stored_drives.keys())
+
+
+def mount(name: str):
+    """ Returns the drive and marks it as most recently used. Stored drives are loaded first.
+    Returns: (drive, return code)
+    """
+    if name in registry:
+        registry.move_to_end(name)
+        return registry[name], FileReturnCodes.SUCCESS
+    if name not in stored_drives:
+        return None, FileReturnCodes.INVALID_PATH
+    drive = load_image(stored_drives[name])
+    drive.name = name  # Images can be attached under a different name.
+    if name in _detached_hubs:
+        drive.watch_hub = _detached_hubs.pop(name)
+    _logger(f"Loaded drive {name} from {stored_drives[name]}")
+    add_drive(drive)
+    return drive, FileReturnCodes.SUCCESS
+
+
+def unmount(name: str, image_path=None) -> int:
+    """ Persists a resident drive and releases it. The drive stays registered and can be mounted again.
+    Arguments:
+    name: name of the drive.
+    image_path: where to persist the drive. Defaults to a file in storage_dir.
+    """
+    if name in _pinned:
+        return FileReturnCodes.UNSUPPORTED
+    if name not in registry:
+        return FileReturnCodes.SUCCESS if name in stored_drives else FileReturnCodes.INVALID_PATH
+    image_path = image_path or _default_image_path(name)
+    save_image(registry[name], image_path)
+    _release(name)
+    stored_drives[name] = image_path
+    _logger(f"Unmounted drive {name} to {image_path}")
+    return FileReturnCodes.SUCCESS
+
+
+def drop(name: str) -> int:
+    """ Removes a drive from the registry. Images created by the registry are deleted as well."""
+    if name in _pinned:
+        return FileReturnCodes.UNSUPPORTED
+    if not is_registered(name):
+        return FileReturnCodes.INVALID_PATH
+    hub = registry[name].watch_hub if name in registry else _detached_hubs.pop(name, None)
+    if hub is not None:
+        hub.close_all(name)  # Subscribers see a delete of / instead of waiting forever.
+    if name in registry:
+        _release(name)
+    stored_drives.pop(name, None)
+    # The default image outlives mounts: a drive unmounted and mounted again still has it on disk.
+    # Images at other paths belong to the caller and are kept.
+    if storage_dir is not None and os.path.exists(_default_image_path(name)):
+        os.remove(_default_image_path(name))
+    _logger(f"Dropped drive {name}")
+    return FileReturnCodes.SUCCESS
+
+
+def pin(name: str):
+    """ Marks a drive as in use. Pinned drives are never evicted, unmounted or dropped."""
+    _pinned[name] = _pinned.get(name, 0) + 1
+
+
+def unpin(name: str):
+    if name not in _pinned:
+        return
+    _pinned[name] -= 1
+    if not _pinned[name]:
+        del _pinned[name]
+        _evict_idle()
+
+
+def set_max_resident_drives(max_drives):
+    """ Sets the resident drive cap and evicts idle drives if needed. None disables the cap."""
+    global max_resident_drives
+    max_resident_drives = max_drives
+    _evict_idle()
+
+
+def save_image(drive, image_path: str):
+    """ Persists a drive to disk."""
+    dir_name = os.path.dirname(image_path)
+    if dir_name:
+        os.makedirs(dir_name, exist_ok=True)
+    import pickle  # Imported on first use to keep startup fast.
+    with open(image_path, "wb") as f:
+        pickle.dump(drive, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def load_image(image_path: str):
+    """ Loads a drive persisted by save_image. Only load images from trusted sources."""
+    import pickle
+    with open(image_path, "rb") as f:
+        return pickle.load(f)
+
+
+def _release(name: str):
+    """ Removes a resident drive. Its text index is dropped, so it no longer counts against writes to every drive.
+    The image, if any, keeps the index and rebuilds it on the next mount. Subscriptions wait for the next mount.
+    """
+    drive = registry.pop(name)
+    drive.disable_text_index()
+    if len(drive.watch_hub):
+        _detached_hubs[name] = drive.watch_hub
+
+
+def _default_image_path(name: str) -> str:
+    global storage_dir
+    if storage_dir is None:
+        import atexit
+        import shutil
+        import tempfile
+        storage_dir = tempfile.mkdtemp(prefix="toymemfs_drives_")
+        atexit.register(shutil.rmtree, storage_dir, ignore_errors=True)
+    return os.path.join(storage_dir, f"{name}.img")
+
+
+def _evict_idle(keep=None):
+    """ Evicts idle drives in LRU order until the resident cap is met. The drive named keep is never evicted."""
+    if max_resident_drives is None:
+        return
+    idle = [name for name in registry if name not in _pinned and name != keep]
+    while len(registry) > max_resident_drives and idle:
+        unmount(idle.pop(0))
+
+
+if __name__ == "__main__":
+    import virtual_mem_drive_registry as drives  # The module that MemFileSystem registers with, not __main__.
+    from mem_fs import MemFileSystem
+    MemFileSystem("images")
+    assert drives.unmount("images") == FileReturnCodes.SUCCESS
+    image_path = drives.stored_drives["images"]
+    drives.mount("images")
+    assert os.path.exists(image_path)
+    assert drives.drop("images") == FileReturnCodes.SUCCESS and not os.path.exists(image_path)
+    print("Registry checks passed.")
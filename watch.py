@@ -0,0 +1,275 @@
+""" Change notifications for in-mem drives.
+Subscribers watch a path prefix and receive create, write, move and delete events through a bounded queue.
+Bursts of writes to the same file are coalesced into one event. Events of a drive operation are held until the
+operation ends, and events of a transaction until it commits, then delivered as one batch. Subscribers never see
+the events of an aborted transaction.
+
+    with drive.watch("/movies") as events:
+        ...
+        event = events.get(timeout=1)   # or: async for event in events
+"""
+from collections import namedtuple, OrderedDict
+import itertools
+import threading
+
+CREATE = "create"
+WRITE = "write"
+MOVE = "move"
+DELETE = "delete"
+
+""" A change to a file.
+    kind: create, write, move or delete.
+    path: absolute path of the file. For moves, this is the old path.
+    drive: name of the drive.
+    count: number of coalesced writes.
+    dest_path: new path for moves. None otherwise.
+"""
+ChangeEvent = namedtuple("ChangeEvent", ["kind", "path", "drive", "count", "dest_path"])
+
+# Number of open subscriptions across all drives. Mutation points skip all event work when it is 0.
+active_subscriptions = 0
+_subscriptions_lock = threading.Lock()
+
+
+def notify(file, kind: str, path=None):
+    """ Publishes an event for file to the drive that holds it. Called from the mutation points.
+    Callers check active_subscriptions first, so this is never reached without subscribers.
+    """
+    drive = file.drive
+    if drive:
+        drive.watch_hub.publish(drive.name, kind, path or file.absolute_path)
+
+
+class WatchHub:
+    """ Holds the subscriptions of a single drive and routes events by path prefix."""
+
+    def __init__(self):
+        self._subscriptions = []
+        # Events held until release(). None when events are delivered as they are published.
+        self._held = None
+
+    def subscribe(self, prefix="/", maxsize=1024):
+        global active_subscriptions
+        subscription = Subscription(self, prefix, maxsize)
+        with _subscriptions_lock:
+            self._subscriptions = self._subscriptions + [subscription]
+            active_subscriptions += 1
+        return subscription
+
+    def unsubscribe(self, subscription):
+        global active_subscriptions
+        with _subscriptions_lock:
+            if subscription in self._subscriptions:
+                self._subscriptions = [
+                    s for s in self._subscriptions if s is not subscription]
+                active_subscriptions -= 1
+
+    def __len__(self):
+        """ Returns the number of open subscriptions."""
+        return len(self._subscriptions)
+
+    def close_all(self, drive_name: str):
+        """ Publishes a delete of / and closes every subscription, e.g. when the drive is dropped.
+        Queued events can still be read.
+        """
+        self._held = None
+        self.publish(drive_name, DELETE, "/")
+        for subscription in self._subscriptions:
+            self.unsubscribe(subscription)
+
+    def publish(self, drive_name: str, kind: str, path: str, dest_path=None):
+        subscriptions = self._subscriptions  # Copy-on-write list. Safe to iterate.
+        if not subscriptions:
+            return
+        event = ChangeEvent(kind, path, drive_name, 1, dest_path)
+        held = self._held
+        if held is not None:
+            held.append(event)
+            return
+        for subscription in subscriptions:
+            if WatchHub._routes_to(subscription, event):
+                subscription.put(event)
+
+    def hold(self):
+        """ Holds published events until release() or discard(). Called by the drive under its lock."""
+        if self._held is None:
+            self._held = []
+
+    def release(self):
+        """ Delivers the held events. Each subscription receives its events as one batch."""
+        held, self._held = self._held, None
+        if not held:
+            return
+        for subscription in self._subscriptions:
+            events = [event for event in held if WatchHub._routes_to(subscription, event)]
+            if events:
+                subscription.put_many(events)
+
+    def discard(self):
+        """ Drops the held events, e.g. when a transaction is aborted."""
+        self._held = None
+
+    @classmethod
+    def _routes_to(cls, subscription, event: ChangeEvent) -> bool:
+        return subscription.matches(event.path) or bool(event.dest_path and subscription.matches(event.dest_path))
+
+
+class Subscription:
+    """ A bounded queue of change events under a path prefix.
+    When the queue is full the oldest event is dropped and `dropped` is incremented, so a consumer
+    knows it must rescan. Supports blocking get() from threads and `await aget()` / `async for` from asyncio.
+    """
+
+    def __init__(self, hub: WatchHub, prefix="/", maxsize=1024):
+        self.prefix = prefix.rstrip("/") or "/"
+        self.maxsize = maxsize
+        self.dropped = 0
+        self._hub = hub
+        self._events = OrderedDict()  # seq -> event
+        self._pending_writes = {}  # path -> seq of a queued write that can absorb new writes.
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._loop = None  # Set by the first aget().
+        self._async_ready = None
+
+    def matches(self, path: str) -> bool:
+        return self.prefix == "/" or path == self.prefix or path.startswith(self.prefix + "/")
+
+    def put(self, event: ChangeEvent):
+        self.put_many([event])
+
+    def put_many(self, events: list[ChangeEvent]):
+        """ Queues events in order. Consumers are woken up once for the whole batch."""
+        with self._cond:
+            for event in events:
+                self._put_locked(event)
+            self._cond.notify()
+        if self._loop:
+            self._loop.call_soon_threadsafe(self._async_ready.set)
+
+    def _put_locked(self, event: ChangeEvent):
+        if event.kind == WRITE and event.path in self._pending_writes:
+            seq = self._pending_writes[event.path]
+            pending = self._events[seq]
+            self._events[seq] = pending._replace(count=pending.count + 1)
+            return
+        # Any other event on these paths ends the burst. Later writes must not jump ahead of it.
+        self._pending_writes.pop(event.path, None)
+        if event.dest_path:
+            self._pending_writes.pop(event.dest_path, None)
+        if len(self._events) >= self.maxsize:
+            self._pop_oldest()
+            self.dropped += 1
+        seq = next(self._seq)
+        self._events[seq] = event
+        if event.kind == WRITE:
+            self._pending_writes[event.path] = seq
+
+    def get(self, timeout=None):
+        """ Returns the next event. Blocks until an event arrives or timeout (seconds) expires.
+        Returns None on timeout.
+        """
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._events, timeout):
+                return None
+            return self._pop_oldest()
+
+    def get_nowait(self):
+        """ Returns the next event or None if the queue is empty."""
+        with self._cond:
+            return self._pop_oldest() if self._events else None
+
+    async def aget(self):
+        """ Waits for the next event without blocking the event loop."""
+        if self._loop is None:
+            import asyncio  # Only needed by asyncio consumers.
+            self._async_ready = asyncio.Event()
+            self._loop = asyncio.get_running_loop()
+        while True:
+            self._async_ready.clear()
+            event = self.get_nowait()
+            if event:
+                return event
+            await self._async_ready.wait()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        return await self.aget()
+
+    def __len__(self):
+        return len(self._events)
+
+    def close(self):
+        self._hub.unsubscribe(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _pop_oldest(self) -> ChangeEvent:
+        seq, event = self._events.popitem(last=False)
+        if self._pending_writes.get(event.path) == seq:
+            del self._pending_writes[event.path]
+        return event
+
+
+if __name__ == "__main__":
+    import asyncio
+    from mem_fs import MemFileSystem, FileType
+    drive = MemFileSystem("watch_test", register=False)
+    drive.make_file(drive.root, "/logs", FileType.DIR)
+    drive.make_file(drive.root, "/logs/app.txt", FileType.TEXT_FILE)
+
+    async def consume(events, num_writes):
+        """ Receives the writes of another thread without blocking the event loop."""
+        received = 0
+        async for event in events:
+            assert event.kind == WRITE and event.path == "/logs/app.txt", event
+            received += event.count
+            if received == num_writes:
+                return received
+
+    def write_lines(num_writes):
+        for i in range(num_writes):
+            drive.write_file(drive.root, "/logs/app.txt", f"line {i}", write_mode="append")
+
+    with drive.watch("/logs") as events:
+        writer = threading.Thread(target=write_lines, args=(1000,))
+
+        async def main():
+            consumer = asyncio.create_task(consume(events, 1000))
+            await asyncio.sleep(0)  # The consumer must be waiting before the first write.
+            writer.start()
+            return await asyncio.wait_for(consumer, timeout=10)
+
+        print("Async consumer received", asyncio.run(main()), "writes.")
+        writer.join()
+        assert events.dropped == 0 and len(events) == 0
+    # Subscriptions survive an unmount or eviction and are reattached on mount. Dropping the drive ends them.
+    import watch  # The module that drives update, not __main__.
+    import virtual_mem_drive_registry
+    num_subscriptions = watch.active_subscriptions
+    stored = MemFileSystem("watch_stored")
+    events = stored.watch("/")
+    for evict in [False, True]:
+        if evict:
+            virtual_mem_drive_registry.set_max_resident_drives(1)
+            MemFileSystem("watch_newer")
+            virtual_mem_drive_registry.set_max_resident_drives(None)
+        else:
+            virtual_mem_drive_registry.unmount("watch_stored")
+        assert not virtual_mem_drive_registry.is_resident("watch_stored")
+        stored, _ = virtual_mem_drive_registry.mount("watch_stored")
+        stored.make_file(stored.root, f"/after_{evict}.txt", FileType.TEXT_FILE)
+        event = events.get_nowait()
+        assert event and (event.kind, event.path) == (CREATE, f"/after_{evict}.txt"), event
+    virtual_mem_drive_registry.unmount("watch_stored")
+    virtual_mem_drive_registry.drop("watch_stored")
+    event = events.get_nowait()
+    assert event and (event.kind, event.path) == (DELETE, "/"), event
+    assert watch.active_subscriptions == num_subscriptions
+    print("Subscriptions survive unmount and eviction.")